@@ -0,0 +1,227 @@
+"""Latency benchmark for the command pipeline.
+
+Drives the Flask app in final.py with a realistic mix of commands against a
+local stand-in for Gemini (configurable latency, canned responses), in-memory
+volume/brightness controllers and a temporary directory for file operations.
+Reports p50/p95/p99 latency and throughput per concurrency level, broken down
+into classification, parsing and execution phases.
+
+Usage:
+    python benchmark.py --requests 200 --concurrency 1 4 16 --gemini-latency 0.5
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+
+import final
+
+class MockGenerativeModel:
+    """Stands in for genai.GenerativeModel: sleeps, then answers from a canned table."""
+
+    def __init__(self, latency, responses):
+        self.latency = latency
+        self.responses = responses
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate_content(self, contents):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        commands = re.findall(r'^(?:User command: |\d+\. )"(.*)"$', contents, re.MULTILINE)
+        if "User commands:" not in contents:
+            text = self.responses.get(commands[0], "UNKNOWN") if commands else "UNKNOWN"
+        else:
+            text = "\n".join(f"{i}. {self.responses.get(command, 'UNKNOWN')}" for i, command in enumerate(commands, 1))
+        usage = types.SimpleNamespace(prompt_token_count=len(contents) // 4, candidates_token_count=len(text) // 4)
+        return types.SimpleNamespace(text=text, usage_metadata=usage)
+
+class FakeLevelController:
+    """In-memory volume/brightness backend so the benchmark never touches real hardware."""
+
+    def __init__(self):
+        self.level = 50
+        self.lock = threading.RLock()
+
+    def get_level(self):
+        return self.level
+
+    def set_level(self, percent):
+        self.level = max(0, min(100, int(percent)))
+        return self.level
+
+    def adjust(self, delta):
+        return self.set_level(self.level + delta)
+
+    def set_mute(self, muted):
+        pass
+
+class PhaseTimer:
+    """Wraps pipeline functions in final.py and records how long each call takes."""
+
+    def __init__(self):
+        self.durations = {}
+        self.lock = threading.Lock()
+
+    def wrap(self, phase, func):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self.lock:
+                    self.durations.setdefault(phase, []).append(elapsed)
+        return timed
+
+    def reset(self):
+        with self.lock:
+            self.durations = {}
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+def build_workload(workdir, count, seed):
+    """Builds a command mix plus the canned Gemini responses for its free-form phrasings."""
+    rng = random.Random(seed)
+    seed_dir = os.path.join(workdir, "seed")
+    os.makedirs(seed_dir, exist_ok=True)
+    commands, responses = [], {}
+
+    for i in range(count):
+        kind = rng.choices(
+            ["create_file", "create_folder", "delete_file", "rename_file", "move_file", "volume", "brightness", "free_form", "unknown"],
+            weights=[20, 10, 10, 10, 10, 15, 10, 10, 5],
+        )[0]
+        seeded = os.path.join(seed_dir, f"item{i}.txt")
+        if kind in ("delete_file", "rename_file", "move_file"):
+            open(seeded, 'w').close()
+
+        if kind == "create_file":
+            commands.append(f"Create a file {os.path.join(workdir, f'file{i}.txt')}")
+        elif kind == "create_folder":
+            commands.append(f"Create a folder {os.path.join(workdir, f'folder{i}')}")
+        elif kind == "delete_file":
+            commands.append(f"Delete file {seeded}")
+        elif kind == "rename_file":
+            commands.append(f"Rename file from {seeded} to {os.path.join(seed_dir, f'renamed{i}.txt')}")
+        elif kind == "move_file":
+            commands.append(f"Move file from {seeded} to {os.path.join(workdir, 'moved', f'item{i}.txt')}")
+        elif kind == "volume":
+            commands.append(rng.choice(["Increase volume", "Decrease volume", "Set volume to 40 percent", "Mute volume"]))
+        elif kind == "brightness":
+            commands.append(rng.choice(["Increase brightness", "Decrease brightness", "Set brightness to 70 percent"]))
+        elif kind == "free_form":
+            # Phrasings the local parser leaves to Gemini; some repeat so the cache sees hits
+            variant = rng.randrange(max(1, count // 10))
+            command = f"could you whip up a folder for my stuff number {variant}"
+            responses[command] = f"CREATE FOLDER {os.path.join(workdir, f'stuff{variant}')}"
+            commands.append(command)
+        else:
+            commands.append(rng.choice(["what's the weather like", "tell me a joke", "open the pod bay doors"]))
+    return commands, responses
+
+def run_level(client_factory, commands, concurrency):
+    """Sends every command through /api/process-command at the given concurrency."""
+    latencies = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def send(command):
+        if not hasattr(local, "client"):
+            local.client = client_factory()
+        started = time.perf_counter()
+        local.client.post('/api/process-command', json={"command": command})
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, commands))
+    return latencies, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the command pipeline against a mock Gemini backend.")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="concurrency levels to run")
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="artificial Gemini latency in seconds")
+    parser.add_argument("--cache-size", type=int, default=1000, help="classification cache size (0 disables it)")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the command mix")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="ultron_bench_")
+    original_cwd = os.getcwd()
+    timer = PhaseTimer()
+    final.classify_command = timer.wrap("classification", final.classify_command)
+    final.parse_formatted_command = timer.wrap("parsing", final.parse_formatted_command)
+    final.execute_operation = timer.wrap("execution", final.execute_operation)
+    final.operation_journal = final.OperationJournal(
+        os.path.join(workdir, "operation_journal.jsonl"), backup_directory=os.path.join(workdir, "backups"))
+    final.command_history = final.CommandHistory(os.path.join(workdir, "command_history.jsonl"))
+    final.volume_adjuster = final.AdjustmentScheduler(FakeLevelController(), final.ADJUSTMENT_WINDOW_SECONDS)
+    final.brightness_adjuster = final.AdjustmentScheduler(FakeLevelController(), final.ADJUSTMENT_WINDOW_SECONDS)
+
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            level_dir = os.path.join(workdir, f"c{concurrency}")
+            commands, responses = build_workload(level_dir, args.requests, args.seed)
+            mock = MockGenerativeModel(args.gemini_latency, responses)
+            final.model = mock
+            final.classification_cache = final.ClassificationCache(
+                os.path.join(level_dir, "classification_cache.json"), max_entries=args.cache_size, save_delay=3600)
+            timer.reset()
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                latencies, elapsed = run_level(final.app.test_client, commands, concurrency)
+
+            phases = {
+                phase: {f"p{int(q * 100)}_ms": percentile(values, q) * 1000 for q in (0.5, 0.95, 0.99)}
+                for phase, values in timer.durations.items()
+            }
+            results.append({
+                "concurrency": concurrency,
+                "requests": len(latencies),
+                "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(latencies, 0.5) * 1000,
+                "p95_ms": percentile(latencies, 0.95) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+                "gemini_calls": mock.calls,
+                "phases": phases,
+            })
+    finally:
+        os.chdir(original_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Gemini latency {args.gemini_latency * 1000:.0f} ms, {args.requests} requests per level")
+    print(f"{'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'gemini':>7}")
+    for result in results:
+        print(f"{result['concurrency']:>5} {result['throughput_rps']:>9.1f} {result['p50_ms']:>9.2f} "
+              f"{result['p95_ms']:>9.2f} {result['p99_ms']:>9.2f} {result['gemini_calls']:>7}")
+        for phase in ("classification", "parsing", "execution"):
+            timings = result["phases"].get(phase)
+            if timings:
+                print(f"      {phase:<15} p50 {timings['p50_ms']:8.3f}  p95 {timings['p95_ms']:8.3f}  p99 {timings['p99_ms']:8.3f} ms")
+
+if __name__ == "__main__":
+    main()
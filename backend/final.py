@@ -1,26 +1,185 @@
+import time
+STARTUP_STARTED = time.perf_counter()
 import os
 import shutil
-import google.generativeai as genai
 import re
 import subprocess
 import platform
+import ntpath
+import threading
+import json
+import atexit
+import asyncio
+import textwrap
+import gzip
+import struct
+import uuid
+import queue
+import errno
+import fnmatch
+import array
+import math
+import sys
+import stat
 import ctypes
-from flask import Flask, request, jsonify
+import ctypes.util
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+from collections import OrderedDict, deque
+from itertools import islice
+from contextlib import contextmanager
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 
+# Startup cost per component, in seconds; heavy dependencies load in a background warm-up
+startup_timings = OrderedDict(imports=time.perf_counter() - STARTUP_STARTED)
+
+@contextmanager
+def startup_step(component):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[component] = time.perf_counter() - started
+
 app = Flask(__name__)  # Fixed underscores
 CORS(app)  # Enable CORS for all routes
 
-GENAI_API_KEY = ""
-genai.configure(api_key=GENAI_API_KEY)
+@app.before_request
+def track_request_start():
+    g.request_started = time.perf_counter()
+    metrics.gauge_add("ultron_requests_in_flight", 1, endpoint=request.endpoint or "unknown")
 
-model = genai.GenerativeModel("gemini-1.5-pro-latest")
+@app.teardown_request
+def track_request_end(error=None):
+    if "request_started" not in g:
+        return
+    endpoint = request.endpoint or "unknown"
+    metrics.gauge_add("ultron_requests_in_flight", -1, endpoint=endpoint)
+    metrics.inc("ultron_requests_total", endpoint=endpoint)
+    metrics.observe("ultron_request_duration_seconds", time.perf_counter() - g.request_started, endpoint=endpoint)
 
-def get_task_from_gemini(command):
-    """Passes user speech text to Gemini for classification."""
-    prompt = f"""
-    Analyze the following command and check if it is related to file/folder operations, volume control, or brightness control:
-    
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(BASE_DIR, "file_manager_config.json")
+
+def load_config():
+    """Loads file_manager_config.json, returning an empty config if it is missing or invalid."""
+    try:
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠ Could not load configuration: {e}")
+        return {}
+
+with startup_step("config"):
+    config = load_config()
+
+# Concurrency limits for the async request pipeline
+GEMINI_MAX_CONCURRENCY = config.get("gemini_max_concurrency", 4)
+REQUEST_TIMEOUT_SECONDS = config.get("request_timeout_seconds", 30)
+gemini_semaphore = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENCY)
+
+class Metrics:
+    """Thread-safe counters, gauges and histograms rendered in Prometheus text format."""
+
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self):
+        self.help = {}
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def describe(self, name, kind, text):
+        self.help[name] = (kind, text)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge_add(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = self.gauges.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * len(self.BUCKETS), 0.0, 0]
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    histogram[0][i] += 1
+                    break
+            histogram[1] += value
+            histogram[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def register_collector(self, collector):
+        """Adds a callable returning (name, value, labels) gauge samples computed at scrape time."""
+        self.collectors.append(collector)
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            histograms = {key: (list(value[0]), value[1], value[2]) for key, value in self.histograms.items()}
+        for collector in self.collectors:
+            for name, value, labels in collector():
+                gauges[(name, tuple(sorted(labels.items())))] = value
+
+        lines = []
+        samples_by_name = {}
+        for (name, labels), value in list(counters.items()) + list(gauges.items()):
+            samples_by_name.setdefault(name, []).append(f"{name}{self._format_labels(labels)} {value}")
+        for (name, labels), (buckets, total, count) in histograms.items():
+            samples = samples_by_name.setdefault(name, [])
+            cumulative = 0
+            for bound, bucket_count in zip(self.BUCKETS, buckets):
+                cumulative += bucket_count
+                samples.append(f"{name}_bucket{self._format_labels(labels, [('le', bound)])} {cumulative}")
+            samples.append(f"{name}_bucket{self._format_labels(labels, [('le', '+Inf')])} {count}")
+            samples.append(f"{name}_sum{self._format_labels(labels)} {total}")
+            samples.append(f"{name}_count{self._format_labels(labels)} {count}")
+
+        for name in sorted(samples_by_name):
+            kind, text = self.help.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples_by_name[name])
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+metrics.describe("ultron_requests_total", "counter", "HTTP requests handled, by endpoint.")
+metrics.describe("ultron_requests_in_flight", "gauge", "HTTP requests currently being handled, by endpoint.")
+metrics.describe("ultron_request_duration_seconds", "histogram", "HTTP request handling time, by endpoint.")
+metrics.describe("ultron_phase_duration_seconds", "histogram", "Time spent in each pipeline phase (classification, parsing, execution).")
+metrics.describe("ultron_classifications_total", "counter", "Command classifications, by source (local, cache, gemini).")
+metrics.describe("ultron_operations_total", "counter", "Executed operations, by type.")
+metrics.describe("ultron_operation_errors_total", "counter", "Operations that failed or were rejected, by type.")
+metrics.describe("ultron_operation_duration_seconds", "histogram", "Execution time of operations, by type.")
+metrics.describe("ultron_gemini_duration_seconds", "histogram", "Latency of Gemini generate_content calls.")
+metrics.describe("ultron_gemini_tokens_total", "counter", "Gemini tokens, by direction (input, output).")
+
+GEMINI_EXAMPLES = """
     Examples:
     - Create a file example.txt
     - Delete file example.txt
@@ -35,6 +194,10 @@ def get_task_from_gemini(command):
     - Navigate to D:\\Work and delete file report.txt
     - Create a file report.txt in C:\\Users\\Documents
     - Create a folder Temp in D:\\Projects
+    - Create folders A and B in D:\\Work and move report.txt into A
+    - Delete all .tmp files in D:\\Work
+    - Move all PDFs from C:\\Users\\Downloads to C:\\Users\\Documents\\Papers
+    - Rename all photos in D:\\Pictures to trip_###.jpg
     
     # New volume control examples:
     - Increase volume
@@ -50,9 +213,9 @@ def get_task_from_gemini(command):
     - Set brightness to 50 percent
     - Set brightness to maximum
     - Set brightness to minimum
-    
-    User command: "{command}"
-    
+"""
+
+GEMINI_FORMAT_RULES = """
     If the command is related to file/folder operations, return a formatted command that clearly specifies:
     1. The operation type (create/delete/rename/move/navigate)
     2. The object type (file/folder)
@@ -65,6 +228,12 @@ def get_task_from_gemini(command):
     - "MOVE FOLDER FROM D:\\source TO E:\\destination"
     - "NAVIGATE TO C:\\path\\to\\location"
     
+    For operations on every file matching a pattern, use ALL with a wildcard pattern (several patterns separated by commas),
+    add RECURSIVE to include subfolders, and use ### in a rename target for a running number:
+    - "DELETE ALL *.tmp IN D:\\Work"
+    - "MOVE ALL RECURSIVE *.pdf FROM C:\\Users\\Downloads TO C:\\Users\\Documents\\Papers"
+    - "RENAME ALL *.jpg,*.jpeg IN D:\\Pictures TO trip_###.jpg"
+    
     If the command is related to volume control, return a formatted command that clearly specifies:
     1. The operation type (VOLUME)
     2. The action (INCREASE/DECREASE/SET/MUTE/UNMUTE)
@@ -90,407 +259,2959 @@ def get_task_from_gemini(command):
     - "BRIGHTNESS MAXIMUM"
     - "BRIGHTNESS MINIMUM"
     
+    If the command asks for several operations, return one formatted command per line, in the order they should run, like:
+    CREATE FOLDER D:\\Work\\A
+    CREATE FOLDER D:\\Work\\B
+    MOVE FILE FROM D:\\Work\\report.txt TO D:\\Work\\A\\report.txt
+    
     If it is not related to file/folder operations, volume control, or brightness control, return "UNKNOWN".
-    """
-    response = model.generate_content(prompt)
+"""
+
+GEMINI_TRIMMED_EXAMPLES = """
+    Examples:
+    - Go to C drive and create a file example.txt
+    - Navigate to D:\\Work and delete file report.txt
+    - Create a folder Temp in D:\\Projects
+    - Rename file from old.txt to new.txt
+    - Set volume to 50 percent
+    - Set brightness to maximum
+"""
+
+GEMINI_EXAMPLE_SETS = {"full": GEMINI_EXAMPLES, "trimmed": GEMINI_TRIMMED_EXAMPLES, "none": ""}
+
+def build_system_instruction(example_set="full"):
+    """Builds the static part of the classification prompt once, without indentation."""
+    examples = GEMINI_EXAMPLE_SETS.get(example_set, GEMINI_EXAMPLES)
+    return "\n".join([
+        "Analyze the following command and check if it is related to file/folder operations, volume control, or brightness control.",
+        textwrap.dedent(examples).strip(),
+        textwrap.dedent(GEMINI_FORMAT_RULES).strip(),
+    ]).strip()
+
+GEMINI_SYSTEM_INSTRUCTION = build_system_instruction(config.get("gemini_prompt_examples", "full"))
+GEMINI_USE_SYSTEM_INSTRUCTION = config.get("gemini_use_system_instruction", True)
+GEMINI_LOG_USAGE = config.get("gemini_log_usage", False)
+
+GENAI_API_KEY = ""
+
+model = None
+model_lock = threading.Lock()
+
+def get_gemini_model():
+    """Imports the Gemini SDK and builds the model on first use; the warm-up thread usually gets there first."""
+    global model
+    with model_lock:
+        if model is None:
+            with startup_step("gemini"):
+                import google.generativeai as genai
+                genai.configure(api_key=GENAI_API_KEY)
+                # The static instructions are sent once as a system instruction; requests only carry the command
+                model = genai.GenerativeModel(
+                    "gemini-1.5-pro-latest",
+                    system_instruction=GEMINI_SYSTEM_INSTRUCTION if GEMINI_USE_SYSTEM_INSTRUCTION else None,
+                )
+    return model
+
+gemini_usage_stats = {"calls": 0, "input_tokens": 0, "output_tokens": 0, "latency_seconds": 0.0}
+gemini_usage_lock = threading.Lock()
+
+def call_gemini(contents):
+    """Sends the per-request part of a prompt to Gemini, recording token usage and latency."""
+    if not GEMINI_USE_SYSTEM_INSTRUCTION:
+        contents = f"{GEMINI_SYSTEM_INSTRUCTION}\n\n{contents}"
+    gemini_model = get_gemini_model()
+    with gemini_semaphore:
+        started = time.perf_counter()
+        response = gemini_model.generate_content(contents)
+        latency = time.perf_counter() - started
+
+    usage = getattr(response, "usage_metadata", None)
+    input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    with gemini_usage_lock:
+        gemini_usage_stats["calls"] += 1
+        gemini_usage_stats["input_tokens"] += input_tokens
+        gemini_usage_stats["output_tokens"] += output_tokens
+        gemini_usage_stats["latency_seconds"] += latency
+    metrics.observe("ultron_gemini_duration_seconds", latency)
+    metrics.inc("ultron_gemini_tokens_total", input_tokens, direction="input")
+    metrics.inc("ultron_gemini_tokens_total", output_tokens, direction="output")
+    if GEMINI_LOG_USAGE:
+        print(f"📊 Gemini call: {input_tokens} input tokens, {output_tokens} output tokens, {latency * 1000:.0f} ms")
     return response.text.strip()
 
+def get_task_from_gemini(command):
+    """Passes user speech text to Gemini for classification."""
+    return call_gemini(f'User command: "{command}"')
+
+BATCH_RESPONSE_PATTERN = re.compile(r'^\s*(\d+)\s*[.):-]\s*"?(.*?)"?\s*$')
+
+def get_tasks_from_gemini_batch(commands):
+    """Classifies several user commands with a single Gemini call."""
+    numbered = "\n".join(f'{i}. "{command}"' for i, command in enumerate(commands, 1))
+    text = call_gemini(
+        f"User commands:\n{numbered}\n\n"
+        "Classify each user command separately and return exactly one line per command, "
+        "in the same order, prefixed with its number. If a command needs several operations, "
+        "put them on its line separated by ' ;; '. For example:\n"
+        "1. CREATE FILE C:\\path\\to\\filename.txt\n"
+        "2. VOLUME INCREASE\n"
+        "3. UNKNOWN"
+    )
+
+    results = ["UNKNOWN"] * len(commands)
+    for line in text.splitlines():
+        match = BATCH_RESPONSE_PATTERN.match(line)
+        if match and 1 <= int(match.group(1)) <= len(commands):
+            steps = [step.strip() for step in match.group(2).split(";;") if step.strip()]
+            results[int(match.group(1)) - 1] = "\n".join(steps) or "UNKNOWN"
+    return results
+
+# Local fast-path parser: well-formed commands are mapped straight onto the
+# formatted grammar understood by interpret_command without calling Gemini.
+FILLER_PREFIX_PATTERN = re.compile(
+    r"^(?:(?:hey|hi|ok|okay)\s+ultron[\s,]*|ultron[\s,]+|please\s+|kindly\s+|"
+    r"(?:can|could|would|will)\s+you\s+(?:please\s+)?|i\s+want\s+(?:you\s+)?to\s+)+",
+    re.IGNORECASE,
+)
+FILLER_SUFFIX_PATTERN = re.compile(r"(?:[\s,]+please)?[\s.!?]*$", re.IGNORECASE)
+DRIVE_PATTERN = re.compile(r"^(?:the\s+)?([a-z])\s*(?:drive|:)$", re.IGNORECASE)
+QUOTED_PATTERN = re.compile(r'^(["\'])(.+)\1$')
+# Words that mean a "name" is really the rest of a sentence ("a folder for my photos")
+RESERVED_OPERAND_WORDS = {
+    "a", "an", "the", "my", "all", "and", "with", "containing", "then", "now", "please", "here", "there",
+    "in", "into", "inside", "under", "on", "onto", "from", "for", "at", "to", "of", "called", "named",
+    "file", "files", "folder", "folders", "directory", "drive",
+}
+RECURSIVE_SUFFIX = r"(\s+(?:recursively|and\s+(?:all\s+)?(?:its\s+)?subfolders|including\s+subfolders))?$"
+BULK_FILE_KINDS = {
+    "files": "*",
+    "pdfs": "*.pdf",
+    "photos": "*.jpg,*.jpeg",
+    "pictures": "*.jpg,*.jpeg",
+    "images": "*.jpg,*.jpeg,*.png,*.gif,*.bmp",
+    "videos": "*.mp4,*.mov,*.avi,*.mkv",
+    "temp files": "*.tmp,*.temp",
+    "temporary files": "*.tmp,*.temp",
+}
+
+LOCAL_COMMAND_PATTERNS = [
+    (re.compile(r"^(?:increase|raise|turn\s+up)\s+(?:the\s+)?volume$|^volume\s+up$", re.IGNORECASE),
+     lambda m: "VOLUME INCREASE"),
+    (re.compile(r"^(?:decrease|lower|reduce|turn\s+down)\s+(?:the\s+)?volume$|^volume\s+down$", re.IGNORECASE),
+     lambda m: "VOLUME DECREASE"),
+    (re.compile(r"^(?:set|change)\s+(?:the\s+)?volume\s+to\s+(?:max|maximum|full)$|^max(?:imum)?\s+volume$", re.IGNORECASE),
+     lambda m: "VOLUME MAXIMUM"),
+    (re.compile(r"^(?:set|change)\s+(?:the\s+)?volume\s+to\s+(\d{1,3})\s*(?:%|percent)?$", re.IGNORECASE),
+     lambda m: f"VOLUME SET {min(100, int(m.group(1)))}"),
+    (re.compile(r"^mute(?:\s+(?:the\s+)?(?:volume|sound|audio))?$", re.IGNORECASE),
+     lambda m: "VOLUME MUTE"),
+    (re.compile(r"^unmute(?:\s+(?:the\s+)?(?:volume|sound|audio))?$", re.IGNORECASE),
+     lambda m: "VOLUME UNMUTE"),
+    (re.compile(r"^(?:increase|raise|turn\s+up)\s+(?:the\s+)?brightness$|^brightness\s+up$", re.IGNORECASE),
+     lambda m: "BRIGHTNESS INCREASE"),
+    (re.compile(r"^(?:decrease|lower|reduce|turn\s+down)\s+(?:the\s+)?brightness$|^brightness\s+down$", re.IGNORECASE),
+     lambda m: "BRIGHTNESS DECREASE"),
+    (re.compile(r"^(?:set|change)\s+(?:the\s+)?brightness\s+to\s+(?:max|maximum|full)$|^max(?:imum)?\s+brightness$", re.IGNORECASE),
+     lambda m: "BRIGHTNESS MAXIMUM"),
+    (re.compile(r"^(?:set|change)\s+(?:the\s+)?brightness\s+to\s+(?:min|minimum)$|^min(?:imum)?\s+brightness$", re.IGNORECASE),
+     lambda m: "BRIGHTNESS MINIMUM"),
+    (re.compile(r"^(?:set|change)\s+(?:the\s+)?brightness\s+to\s+(\d{1,3})\s*(?:%|percent)?$", re.IGNORECASE),
+     lambda m: f"BRIGHTNESS SET {min(100, int(m.group(1)))}"),
+    (re.compile(r"^(?:delete|remove)\s+all\s+(?:(?:of\s+)?the\s+|my\s+)?(.+?)\s+(?:in|from|inside|under)\s+(.+?)" + RECURSIVE_SUFFIX, re.IGNORECASE),
+     lambda m: _format_bulk("DELETE", m.group(1), m.group(2), None, m.group(3))),
+    (re.compile(r"^move\s+all\s+(?:(?:of\s+)?the\s+|my\s+)?(.+?)\s+from\s+(.+?)\s+(?:to|into)\s+(.+?)" + RECURSIVE_SUFFIX, re.IGNORECASE),
+     lambda m: _format_bulk("MOVE", m.group(1), m.group(2), m.group(3), m.group(4))),
+    (re.compile(r"^rename\s+(?:all\s+)?(?:(?:of\s+)?the\s+|my\s+)?(.+?)(?:\s+in\s+(.+?))?\s+to\s+(\S*#\S*)" + RECURSIVE_SUFFIX, re.IGNORECASE),
+     lambda m: _format_bulk("RENAME", m.group(1), m.group(2), m.group(3), m.group(4))),
+    (re.compile(r"^(create|make|delete|remove)\s+(?:a\s+|an\s+|the\s+|new\s+)*(file|folder|directory)\s+(?:named\s+|called\s+)?"
+                r"(.+?)(?:\s+(?:in|inside|under)\s+(.+))?$", re.IGNORECASE),
+     lambda m: _format_create_or_delete(m.group(1), m.group(2), m.group(3), m.group(4))),
+    (re.compile(r"^(rename|move)\s+(?:the\s+)?(file|folder|directory)\s+(?:from\s+)?(.+?)\s+(?:to|into)\s+(.+)$", re.IGNORECASE),
+     lambda m: _format_rename_or_move(m.group(1), m.group(2), m.group(3), m.group(4))),
+    (re.compile(r"^(?:(?:navigate|go|change\s+directory)\s+to|cd)\s+(.+)$", re.IGNORECASE),
+     lambda m: f"NAVIGATE TO {_resolve_location(m.group(1))}" if _operand(m.group(1)) else None),
+]
+PLAN_SEPARATOR_PATTERN = re.compile(r"\s*(?:[,;]\s*(?:and\s+)?then\b|\band\s+then\b|;)\s*", re.IGNORECASE)
+COMPOUND_NAVIGATION_PATTERN = re.compile(r"^(?:navigate|go)\s+to\s+(.+?)\s+and\s+(?:then\s+)?(.+)$", re.IGNORECASE)
+
+local_parser_stats = {"hits": 0, "misses": 0}
+local_parser_stats_lock = threading.Lock()
+
+def _operand(text):
+    """Returns a file name, path or location if text is clearly one, otherwise None.
+
+    Accepts a quoted string, a spoken drive ("D drive") or a single token
+    that isn't a filler or preposition; anything longer is left to Gemini.
+    """
+    text = text.strip()
+    quoted = QUOTED_PATTERN.match(text)
+    if quoted:
+        return quoted.group(2)
+    if DRIVE_PATTERN.match(text):
+        return text
+    if not text or " " in text or text.lower() in RESERVED_OPERAND_WORDS:
+        return None
+    return text
+
+def _resolve_location(location):
+    """Turns spoken locations like 'C drive' into a usable path."""
+    location = location.strip().strip('"\'')
+    drive_match = DRIVE_PATTERN.match(location)
+    if drive_match:
+        return f"{drive_match.group(1).upper()}:\\"
+    return location
+
+def _path_module(path):
+    """Gemini and spoken commands use Windows paths; join them the Windows way."""
+    return ntpath if "\\" in path or DRIVE_PATTERN.match(path) else os.path
+
+def _format_create_or_delete(verb, kind, name, directory):
+    operation = "CREATE" if verb.lower() in ("create", "make") else "DELETE"
+    object_type = "FILE" if kind.lower() == "file" else "FOLDER"
+    # Anything that reads like extra instructions is left to Gemini
+    name = _operand(name)
+    if name is None or (directory and _operand(directory) is None):
+        return None
+    if directory:
+        directory = _resolve_location(_operand(directory))
+        name = _path_module(directory).join(directory, name)
+    return f"{operation} {object_type} {name}"
+
+def _format_rename_or_move(verb, kind, source, destination):
+    operation = verb.upper()
+    object_type = "FILE" if kind.lower() == "file" else "FOLDER"
+    source, destination = _operand(source), _operand(destination)
+    if source is None or destination is None:
+        return None
+    source = _resolve_location(source)
+    destination = _resolve_location(destination)
+    # "Rename file from C:\a\old.txt to new.txt" keeps the file in its directory
+    path_module = _path_module(source)
+    if operation == "RENAME" and not path_module.dirname(destination):
+        destination = path_module.join(path_module.dirname(source), destination)
+    return f"{operation} {object_type} FROM {source} TO {destination}"
+
+def _bulk_pattern(description):
+    """Turns "*.tmp", "tmp files", ".tmp" or "PDFs" into a glob pattern; returns None if unsure."""
+    description = description.strip().strip('"\'')
+    if "*" in description or "?" in description:
+        pattern = re.sub(r"\s+files$", "", description, flags=re.IGNORECASE)
+        return None if " " in pattern else pattern
+    if description.lower() in BULK_FILE_KINDS:
+        return BULK_FILE_KINDS[description.lower()]
+    extension = (re.match(r"^\.?(\w+)\s+files$", description, re.IGNORECASE)
+                 or re.match(r"^\.(\w+)$", description)
+                 or re.match(r"^([A-Z0-9]{2,4})s$", description))
+    return f"*.{extension.group(1).lower()}" if extension else None
+
+def _format_bulk(operation, description, directory, target, recursive):
+    pattern = _bulk_pattern(description)
+    if pattern is None or (directory and _operand(directory) is None) or (target and _operand(target) is None):
+        return None
+    directory = directory and _operand(directory)
+    target = target and _operand(target)
+    directory = _resolve_location(directory) if directory else "."
+    flag = "RECURSIVE " if recursive else ""
+    if operation == "DELETE":
+        return f"DELETE ALL {flag}{pattern} IN {directory}"
+    if operation == "MOVE":
+        return f"MOVE ALL {flag}{pattern} FROM {directory} TO {_resolve_location(target)}"
+    return f"RENAME ALL {flag}{pattern} IN {directory} TO {target}"
+
+def parse_command_locally(command):
+    """Maps well-formed commands onto the formatted grammar; returns None if unsure."""
+    text = FILLER_PREFIX_PATTERN.sub("", command.strip())
+    text = FILLER_SUFFIX_PATTERN.sub("", text)
+    text = re.sub(r"\s+", " ", text)
+
+    # "X, then Y" / "X and then Y" becomes a multi-step plan if every step parses
+    steps = [step for step in PLAN_SEPARATOR_PATTERN.split(text) if step]
+    if len(steps) > 1:
+        formatted_steps = [parse_command_locally(step) for step in steps]
+        if all(formatted_steps):
+            return "\n".join(formatted_steps)
+        return None
+
+    compound = COMPOUND_NAVIGATION_PATTERN.match(text)
+    if compound:
+        if _operand(compound.group(1)) is None:
+            return None
+        location = _resolve_location(_operand(compound.group(1)))
+        inner = parse_command_locally(f"{compound.group(2)} in {location}")
+        if inner and inner.split()[0] in ("CREATE", "DELETE"):
+            return inner
+        return None
+
+    for pattern, formatter in LOCAL_COMMAND_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            return formatter(match)
+    return None
+
+FILLER_WORDS = {"um", "uh", "erm", "hmm", "please", "kindly", "just"}
+
+def normalize_command(command):
+    """Normalizes case, whitespace and filler words so equivalent phrasings share a cache key."""
+    text = FILLER_PREFIX_PATTERN.sub("", command.strip())
+    text = FILLER_SUFFIX_PATTERN.sub("", text)
+    words = [word for word in text.lower().split() if word.strip(",") not in FILLER_WORDS]
+    return " ".join(words)
+
+class ClassificationCache:
+    """LRU cache of Gemini classifications with a TTL, persisted to disk between restarts."""
+
+    def __init__(self, path, max_entries=1000, ttl_seconds=86400, save_delay=2.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.save_delay = save_delay
+        self.entries = OrderedDict()  # key -> (formatted command, created timestamp)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.save_timer = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"⚠ Ignoring unreadable classification cache: {e}")
+            return
+        now = time.time()
+        for key, formatted, created in stored:
+            if now - created < self.ttl_seconds:
+                self.entries[key] = (formatted, created)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        with self.lock:
+            self.save_timer = None
+            stored = [[key, formatted, created] for key, (formatted, created) in self.entries.items()]
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(stored, f)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"⚠ Could not save classification cache: {e}")
+
+    def _schedule_save(self):
+        # Bursts of new entries are written out together
+        if self.save_timer is None:
+            self.save_timer = threading.Timer(self.save_delay, self.save)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def get(self, command, record=True):
+        """Looks a command up; record=False leaves hit/miss counts alone (used for speculative lookups)."""
+        key = normalize_command(command)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and time.time() - entry[1] >= self.ttl_seconds:
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                if record:
+                    self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            if record:
+                self.hits += 1
+            return entry[0]
+
+    def record(self, hit):
+        """Counts a lookup that was made earlier with record=False, once its answer is actually used."""
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, command, formatted):
+        key = normalize_command(command)
+        with self.lock:
+            self.entries[key] = (formatted, time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._schedule_save()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            now = time.time()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "size": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "entries": [
+                    {"command": key, "response": formatted, "age_seconds": round(now - created, 1)}
+                    for key, (formatted, created) in reversed(self.entries.items())
+                ]
+            }
+
+with startup_step("classification_cache"):
+    classification_cache = ClassificationCache(
+        os.path.join(BASE_DIR, config.get("classification_cache_file", "classification_cache.json")),
+        max_entries=config.get("classification_cache_size", 1000),
+        ttl_seconds=config.get("classification_cache_ttl", 86400),
+    )
+atexit.register(classification_cache.save)
+
+metrics.describe("ultron_classification_cache_entries", "gauge", "Entries held in the classification cache.")
+metrics.register_collector(lambda: [("ultron_classification_cache_entries", len(classification_cache.entries), {})])
+
+def _classify_without_gemini(command):
+    """Tries the local parser, then the classification cache; returns None on a miss."""
+    formatted = parse_command_locally(command)
+    with local_parser_stats_lock:
+        local_parser_stats["hits" if formatted else "misses"] += 1
+    if formatted:
+        metrics.inc("ultron_classifications_total", source="local")
+        return formatted
+    formatted = classification_cache.get(command)
+    metrics.inc("ultron_classifications_total", source="cache" if formatted is not None else "gemini")
+    return formatted
+
+def record_classification_source(source):
+    """Counts a classification that was worked out ahead of time ("local", "cache" or "gemini") when it is used."""
+    with local_parser_stats_lock:
+        local_parser_stats["hits" if source == "local" else "misses"] += 1
+    if source != "local":
+        classification_cache.record(source == "cache")
+    metrics.inc("ultron_classifications_total", source=source)
+
+def classify_command(command):
+    """Classifies a user command via the local parser, then the cache, then Gemini."""
+    with metrics.timer("ultron_phase_duration_seconds", phase="classification"):
+        formatted = _classify_without_gemini(command)
+        if formatted is None:
+            formatted = get_task_from_gemini(command)
+            classification_cache.put(command, formatted)
+    return formatted
+
+def classify_commands(commands):
+    """Classifies a list of commands, sending every local/cache miss to Gemini in one call."""
+    results = [_classify_without_gemini(command) for command in commands]
+    pending = [i for i, formatted in enumerate(results) if formatted is None]
+    if pending:
+        batch = get_tasks_from_gemini_batch([commands[i] for i in pending])
+        for i, formatted in zip(pending, batch):
+            results[i] = formatted
+            classification_cache.put(commands[i], formatted)
+    return results
+
+class SpeculativeClassifier:
+    """Classifies text the user is still typing or saying, so a matching submit can skip the wait.
+
+    Each prepare() supersedes the previous draft. Drafts the local parser or
+    cache can answer are ready at once; others go to Gemini once no newer
+    draft has arrived for debounce_seconds. Only one speculative Gemini call
+    runs at a time, and drafts replaced before their turn are never sent.
+    Speculative results stay out of the classification cache and the
+    classification counts until a submit actually uses them; then they are
+    counted under the source that answered them.
+    """
+
+    def __init__(self, classify, debounce_seconds=0.3, max_entries=32):
+        self.classify = classify
+        self.debounce_seconds = debounce_seconds
+        self.max_entries = max_entries
+        self.results = OrderedDict()  # draft text -> Future of (formatted command, source)
+        self.latest = None  # (key, text) of the newest draft
+        self.timer = None
+        self.running = False
+        self.lock = threading.Lock()
+        self.stats = {"prepared": 0, "hits": 0, "misses": 0, "superseded": 0, "classified": 0}
+
+    def _store(self, key):
+        future = Future()
+        self.results[key] = future
+        self.results.move_to_end(key)
+        while len(self.results) > self.max_entries:
+            self.results.popitem(last=False)
+        return future
+
+    @staticmethod
+    def _key(text):
+        # Only whitespace is folded: normalize_command drops case, which names in the parsed command keep
+        return " ".join(text.split())
+
+    def prepare(self, text, immediate=False):
+        """Registers the newest draft; returns "ready", "pending" or "scheduled"."""
+        if not normalize_command(text):
+            return "empty"
+        key = self._key(text)
+        with self.lock:
+            self.stats["prepared"] += 1
+            self.latest = (key, text)
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+                self.stats["superseded"] += 1
+            future = self.results.get(key)
+            if future is not None:
+                return "ready" if future.done() else "pending"
+
+        formatted, source = parse_command_locally(text), "local"
+        if formatted is None:
+            formatted, source = classification_cache.get(text, record=False), "cache"
+        if formatted is not None:
+            with self.lock:
+                self._store(key).set_result((formatted, source))
+            return "ready"
+
+        with self.lock:
+            if immediate:
+                threading.Thread(target=self._classify_latest, daemon=True).start()
+            else:
+                self.timer = threading.Timer(self.debounce_seconds, self._classify_latest)
+                self.timer.daemon = True
+                self.timer.start()
+        return "scheduled"
+
+    def _classify_latest(self):
+        with self.lock:
+            self.timer = None
+            if self.running or self.latest is None or self.latest[0] in self.results:
+                return
+            key, text = self.latest
+            future = self._store(key)
+            self.running = True
+            self.stats["classified"] += 1
+        try:
+            future.set_result((self.classify(text), "gemini"))
+        except Exception as e:
+            future.set_exception(e)
+            with self.lock:
+                if self.results.get(key) is future:
+                    del self.results[key]
+        finally:
+            with self.lock:
+                self.running = False
+                stale = self.latest is not None and self.latest[0] not in self.results
+        if stale:
+            # The user kept going while Gemini was busy; classify where they are now
+            self._classify_latest()
+
+    def take(self, text, timeout=None):
+        """Returns the prepared classification of text, waiting for it if it is still running.
+
+        Returns None when nothing usable was prepared.
+        """
+        key = self._key(text)
+        with self.lock:
+            future = self.results.get(key)
+            if future is None:
+                self.stats["misses"] += 1
+                if self.latest is not None and self.latest[0] == key and self.timer is not None:
+                    # The submit arrived before the debounce fired; the caller classifies it now
+                    self.timer.cancel()
+                    self.timer = None
+                return None
+        try:
+            formatted, source = future.result(timeout)
+        except Exception:
+            with self.lock:
+                self.stats["misses"] += 1
+            return None
+        with self.lock:
+            self.stats["hits"] += 1
+            if source == "gemini" and self.results.get(key) is future:
+                # It lives in the classification cache from now on, and counts as a cache hit there
+                del self.results[key]
+        if source == "gemini":
+            # Only Gemini answers a submit relied on are worth keeping for next time
+            classification_cache.put(text, formatted)
+        record_classification_source(source)
+        return formatted
+
+    def snapshot(self):
+        with self.lock:
+            return {**self.stats, "entries": len(self.results), "running": self.running}
+
+speculative_classifier = SpeculativeClassifier(
+    get_task_from_gemini,
+    debounce_seconds=config.get("prepare_debounce_ms", 300) / 1000.0,
+)
+
+def classify_or_take_prepared(command):
+    """Uses the prepared classification of a command when there is one, otherwise classifies it now."""
+    formatted = speculative_classifier.take(command, timeout=REQUEST_TIMEOUT_SECONDS)
+    return formatted if formatted is not None else classify_command(command)
+
+# OS controls: each backend is opened once and its handle kept alive,
+# so repeated adjustments don't re-import, re-activate or re-scan anything.
+BACKLIGHT_DIR = config.get("backlight_directory", "/sys/class/backlight/")
+
+def run_quietly(args):
+    """Runs an OS control command without a shell and without echoing its output."""
+    return subprocess.run(args, capture_output=True, text=True)
+
+class VolumeController:
+    """Keeps the platform volume backend open between calls."""
+
+    def __init__(self, system=None):
+        self.system = system or platform.system()
+        self.endpoint = None
+        self.lock = threading.RLock()
+
+    def _open_endpoint(self):
+        from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume
+        from ctypes import cast, POINTER
+        from comtypes import CLSCTX_ALL
+
+        devices = AudioUtilities.GetSpeakers()
+        interface = devices.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None)
+        return cast(interface, POINTER(IAudioEndpointVolume))
+
+    def _with_endpoint(self, operation):
+        """Runs an operation on the cached endpoint, re-activating it once if it has gone stale."""
+        with self.lock:
+            for attempt in range(2):
+                if self.endpoint is None:
+                    self.endpoint = self._open_endpoint()
+                try:
+                    return operation(self.endpoint)
+                except Exception:
+                    self.endpoint = None
+                    if attempt:
+                        raise
+
+    def warm_up(self):
+        """Opens the backend ahead of the first command (pycaw and comtypes are slow to import)."""
+        if self.system == "Windows":
+            self._with_endpoint(lambda volume: None)
+
+    def get_level(self):
+        """Returns the current volume percentage, or None if the backend can't report it cheaply."""
+        if self.system == "Windows":
+            return round(self._with_endpoint(lambda volume: volume.GetMasterVolumeLevelScalar()) * 100)
+        return None
+
+    def set_level(self, percent):
+        percent = max(0, min(100, int(percent)))
+        if self.system == "Windows":
+            self._with_endpoint(lambda volume: volume.SetMasterVolumeLevelScalar(percent / 100.0, None))
+        elif self.system == "Darwin":
+            run_quietly(["osascript", "-e", f"set volume output volume {percent}"])
+        elif self.system == "Linux":
+            run_quietly(["amixer", "-D", "pulse", "sset", "Master", f"{percent}%"])
+        else:
+            raise NotImplementedError
+        return percent
+
+    def adjust(self, delta):
+        """Changes the volume by delta percent; returns the new level when it is known."""
+        if self.system == "Windows":
+            with self.lock:
+                return self.set_level(self.get_level() + delta)
+        if self.system == "Darwin":
+            sign = "+" if delta >= 0 else "-"
+            run_quietly(["osascript", "-e", f"set volume output volume (output volume of (get volume settings) {sign} {abs(delta)})"])
+        elif self.system == "Linux":
+            sign = "+" if delta >= 0 else "-"
+            run_quietly(["amixer", "-D", "pulse", "sset", "Master", f"{abs(delta)}%{sign}"])
+        else:
+            raise NotImplementedError
+        return None
+
+    def set_mute(self, muted):
+        if self.system == "Windows":
+            self._with_endpoint(lambda volume: volume.SetMute(1 if muted else 0, None))
+        elif self.system == "Darwin":
+            run_quietly(["osascript", "-e", "set volume with output muted" if muted else "set volume without output muted"])
+        elif self.system == "Linux":
+            run_quietly(["amixer", "-D", "pulse", "sset", "Master", "mute" if muted else "unmute"])
+        else:
+            raise NotImplementedError
+
+class BrightnessController:
+    """Keeps the platform brightness backend open and caches static properties like max brightness."""
+
+    def __init__(self, system=None, backlight_dir=BACKLIGHT_DIR):
+        self.system = system or platform.system()
+        self.backlight_dir = backlight_dir
+        self.backend = None
+        self.handle = None
+        self.max_brightness = None
+        self.lock = threading.RLock()
+
+    def _open(self):
+        """Picks and opens the best available backend for this platform."""
+        if self.system == "Windows":
+            try:
+                import wmi
+            except ImportError:
+                return "powershell", None
+            wmi_instance = wmi.WMI(namespace='root\\WMI')
+            if not wmi_instance.WmiMonitorBrightness():
+                raise NotImplementedError
+            return "wmi", (wmi_instance, wmi_instance.WmiMonitorBrightnessMethods()[0])
+
+        if self.system == "Darwin":
+            return "brightness", None
+
+        if self.system == "Linux":
+            try:
+                devices = sorted(os.listdir(self.backlight_dir))
+                if devices:
+                    device_dir = os.path.join(self.backlight_dir, devices[0])
+                    with open(os.path.join(device_dir, "max_brightness"), 'r') as f:
+                        self.max_brightness = int(f.read().strip())
+                    return "sysfs", os.path.join(device_dir, "brightness")
+            except (OSError, ValueError):
+                pass
+            return "xbacklight", None
+
+        raise NotImplementedError
+
+    def _with_backend(self, operation):
+        """Runs an operation on the cached backend, re-opening it once if it fails."""
+        with self.lock:
+            for attempt in range(2):
+                if self.backend is None:
+                    self.backend, self.handle = self._open()
+                try:
+                    return operation(self.backend, self.handle)
+                except NotImplementedError:
+                    raise
+                except Exception:
+                    # An unwritable sysfs node falls back to xbacklight, anything else is re-opened
+                    if self.backend == "sysfs":
+                        self.backend, self.handle = "xbacklight", None
+                    else:
+                        self.backend = self.handle = None
+                    if attempt:
+                        raise
+
+    def warm_up(self):
+        """Opens the backend ahead of the first command (wmi is slow to import)."""
+        self._with_backend(lambda backend, handle: None)
+
+    def get_level(self):
+        """Returns the current brightness percentage, or None if the backend can't report it cheaply."""
+        def read(backend, handle):
+            if backend == "wmi":
+                return handle[0].WmiMonitorBrightness()[0].CurrentBrightness
+            if backend == "sysfs":
+                with open(handle, 'r') as f:
+                    return (int(f.read().strip()) / self.max_brightness) * 100
+            return None
+        return self._with_backend(read)
+
+    def set_level(self, percent):
+        percent = max(0, min(100, percent))
+
+        def write(backend, handle):
+            if backend == "wmi":
+                handle[1].WmiSetBrightness(int(percent), 0)
+            elif backend == "sysfs":
+                with open(handle, 'w') as f:
+                    f.write(str(int((percent / 100) * self.max_brightness)))
+            elif backend == "powershell":
+                run_quietly(["powershell", "-command", f"(Get-WmiObject -Namespace root/WMI -Class WmiMonitorBrightnessMethods).WmiSetBrightness(1,{int(percent)})"])
+            elif backend == "brightness":
+                run_quietly(["brightness", str(percent / 100.0)])
+            elif backend == "xbacklight":
+                run_quietly(["xbacklight", "-set", str(int(percent))])
+        self._with_backend(write)
+        return percent
+
+    def adjust(self, delta):
+        """Changes the brightness by delta percent; returns the new level when it is known."""
+        with self.lock:
+            current = self.get_level()
+            if current is not None:
+                return self.set_level(current + delta)
+
+            def step(backend, handle):
+                if backend == "powershell":
+                    run_quietly(["powershell", "-command", f"(Get-WmiObject -Namespace root/WMI -Class WmiMonitorBrightnessMethods).WmiSetBrightness(1,{delta})"])
+                elif backend == "brightness":
+                    run_quietly(["brightness", "-i" if delta >= 0 else "-d", str(abs(delta))])
+                elif backend == "xbacklight":
+                    run_quietly(["xbacklight", "-inc" if delta >= 0 else "-dec", str(abs(delta))])
+            self._with_backend(step)
+            return None
+
+class AdjustmentScheduler:
+    """Coalesces bursts of level changes into as few hardware writes as possible.
+
+    A request that finds the scheduler idle is written straight away. Requests
+    arriving while a write is in progress, or less than `window` seconds after
+    the last one, are merged into the next write: a SET discards everything
+    queued before it, deltas are summed on top of it (or the current level),
+    and every waiting caller gets the final level. The caller that opened a
+    batch performs its write, so nobody keeps writing on behalf of later callers.
+    """
+
+    def __init__(self, controller, window=0.0):
+        self.controller = controller
+        self.window = window
+        self.pending = None
+        self.writing = False
+        self.last_write = float("-inf")
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.writes = 0
+
+    def _submit(self, operation):
+        with self.lock:
+            self.requests += 1
+            owner = self.pending is None
+            if owner:
+                # Whoever opens a batch writes it, once the write ahead of it is done
+                self.pending = {"operations": [], "future": Future(), "turn": threading.Event()}
+            batch = self.pending
+            batch["operations"].append(operation)
+            if not self.writing:
+                self.writing = True
+                batch["turn"].set()
+
+        if owner:
+            batch["turn"].wait()
+            self._write(batch)
+        return batch["future"].result()
+
+    def _write(self, batch):
+        """Writes one batch, at least `window` after the last write, then hands over to the next batch's owner."""
+        with self.lock:
+            wait = self.last_write + self.window - time.monotonic()
+        if wait > 0:
+            # Anything else arriving during the wait joins this write
+            time.sleep(wait)
+        with self.lock:
+            self.pending = None
+            self.writes += 1
+        try:
+            batch["future"].set_result(self._apply(batch["operations"]))
+        except Exception as e:
+            batch["future"].set_exception(e)
+        with self.lock:
+            self.last_write = time.monotonic()
+            if self.pending is None:
+                self.writing = False
+            else:
+                self.pending["turn"].set()
+
+    def _apply(self, operations):
+        base, delta = None, 0
+        for kind, value in operations:
+            if kind == "set":
+                base, delta = value, 0
+            else:
+                delta += value
+        with self.controller.lock:
+            if base is None:
+                base = self.controller.get_level()
+            if base is None:
+                # The backend can't report its level, so send the merged step instead
+                return self.controller.adjust(delta)
+            return self.controller.set_level(max(0, min(100, round(base + delta))))
+
+    def adjust(self, delta):
+        return self._submit(("delta", delta))
+
+    def set_level(self, percent):
+        return self._submit(("set", percent))
+
+# 0 merges only requests that arrive during a write; a positive window also spaces writes out for slow backends
+ADJUSTMENT_WINDOW_SECONDS = config.get("adjustment_window_ms", 0) / 1000.0
+
+volume_controller = VolumeController()
+brightness_controller = BrightnessController()
+volume_adjuster = AdjustmentScheduler(volume_controller, ADJUSTMENT_WINDOW_SECONDS)
+brightness_adjuster = AdjustmentScheduler(brightness_controller, ADJUSTMENT_WINDOW_SECONDS)
+
 def control_volume(action, level=None):
     """Controls system volume based on the specified action and level."""
     try:
-        system = platform.system()
-        
-        if system == "Windows":
-            from pycaw.pycaw import AudioUtilities, IAudioEndpointVolume
-            from ctypes import cast, POINTER
-            from comtypes import CLSCTX_ALL
+        if action == "INCREASE":
+            new_level = volume_adjuster.adjust(10)
+            return f"🔊 Volume increased to {new_level}%" if new_level is not None else "🔊 Volume increased"
             
-            devices = AudioUtilities.GetSpeakers()
-            interface = devices.Activate(IAudioEndpointVolume._iid_, CLSCTX_ALL, None)  # Added underscores
-            volume = cast(interface, POINTER(IAudioEndpointVolume))
+        elif action == "DECREASE":
+            new_level = volume_adjuster.adjust(-10)
+            return f"🔉 Volume decreased to {new_level}%" if new_level is not None else "🔉 Volume decreased"
             
-            if action == "INCREASE":
-                current_vol = volume.GetMasterVolumeLevelScalar()
-                new_vol = min(1.0, current_vol + 0.1)
-                volume.SetMasterVolumeLevelScalar(new_vol, None)
-                return f"🔊 Volume increased to {int(new_vol * 100)}%"
-                
-            elif action == "DECREASE":
-                current_vol = volume.GetMasterVolumeLevelScalar()
-                new_vol = max(0.0, current_vol - 0.1)
-                volume.SetMasterVolumeLevelScalar(new_vol, None)
-                return f"🔉 Volume decreased to {int(new_vol * 100)}%"
-                
-            elif action == "SET" and level is not None:
-                level_float = float(level) / 100.0
-                volume.SetMasterVolumeLevelScalar(level_float, None)
-                return f"🔊 Volume set to {level}%"
-                
-            elif action == "MUTE":
-                volume.SetMute(1, None)
-                return "🔇 Volume muted"
-                
-            elif action == "UNMUTE":
-                volume.SetMute(0, None)
-                return "🔊 Volume unmuted"
-                
-            elif action == "MAXIMUM":
-                volume.SetMasterVolumeLevelScalar(1.0, None)
-                return "🔊 Volume set to maximum (100%)"
-                
-        elif system == "Darwin":  # macOS
-            if action == "INCREASE":
-                os.system("osascript -e 'set volume output volume (output volume of (get volume settings) + 10)'")
-                return "🔊 Volume increased"
-                
-            elif action == "DECREASE":
-                os.system("osascript -e 'set volume output volume (output volume of (get volume settings) - 10)'")
-                return "🔉 Volume decreased"
-                
-            elif action == "SET" and level is not None:
-                os.system(f"osascript -e 'set volume output volume {level}'")
-                return f"🔊 Volume set to {level}%"
-                
-            elif action == "MUTE":
-                os.system("osascript -e 'set volume with output muted'")
-                return "🔇 Volume muted"
-                
-            elif action == "UNMUTE":
-                os.system("osascript -e 'set volume without output muted'")
-                return "🔊 Volume unmuted"
-                
-            elif action == "MAXIMUM":
-                os.system("osascript -e 'set volume output volume 100'")
-                return "🔊 Volume set to maximum (100%)"
-                
-        elif system == "Linux":
-            if action == "INCREASE":
-                os.system("amixer -D pulse sset Master 10%+")
-                return "🔊 Volume increased"
-                
-            elif action == "DECREASE":
-                os.system("amixer -D pulse sset Master 10%-")
-                return "🔉 Volume decreased"
-                
-            elif action == "SET" and level is not None:
-                os.system(f"amixer -D pulse sset Master {level}%")
-                return f"🔊 Volume set to {level}%"
-                
-            elif action == "MUTE":
-                os.system("amixer -D pulse sset Master mute")
-                return "🔇 Volume muted"
-                
-            elif action == "UNMUTE":
-                os.system("amixer -D pulse sset Master unmute")
-                return "🔊 Volume unmuted"
-                
-            elif action == "MAXIMUM":
-                os.system("amixer -D pulse sset Master 100%")
-                return "🔊 Volume set to maximum (100%)"
+        elif action == "SET" and level is not None:
+            new_level = volume_adjuster.set_level(level)
+            return f"🔊 Volume set to {new_level}%"
+            
+        elif action == "MUTE":
+            volume_controller.set_mute(True)
+            return "🔇 Volume muted"
+            
+        elif action == "UNMUTE":
+            volume_controller.set_mute(False)
+            return "🔊 Volume unmuted"
+            
+        elif action == "MAXIMUM":
+            volume_adjuster.set_level(100)
+            return "🔊 Volume set to maximum (100%)"
                 
         return "⚠ Volume control not implemented for your operating system."
         
+    except NotImplementedError:
+        return "⚠ Volume control not implemented for your operating system."
     except Exception as e:
         return f"⚠ Error controlling volume: {e}"
 
 def control_brightness(action, level=None):
     """Controls system brightness based on the specified action and level."""
     try:
-        system = platform.system()
-        
-        if system == "Windows":
-            try:
-                import wmi
-                wmi_instance = wmi.WMI(namespace='root\\WMI')
-                monitors = wmi_instance.WmiMonitorBrightness()
-                
-                if len(monitors) > 0:
-                    brightness_methods = wmi_instance.WmiMonitorBrightnessMethods()[0]
-                    current_brightness = monitors[0].CurrentBrightness
-                    
-                    if action == "INCREASE":
-                        new_brightness = min(100, current_brightness + 10)
-                        brightness_methods.WmiSetBrightness(new_brightness, 0)
-                        return f"☀ Brightness increased to {new_brightness}%"
-                        
-                    elif action == "DECREASE":
-                        new_brightness = max(0, current_brightness - 10)
-                        brightness_methods.WmiSetBrightness(new_brightness, 0)
-                        return f"🔆 Brightness decreased to {new_brightness}%"
-                        
-                    elif action == "SET" and level is not None:
-                        brightness_methods.WmiSetBrightness(int(level), 0)
-                        return f"☀ Brightness set to {level}%"
-                        
-                    elif action == "MAXIMUM":
-                        brightness_methods.WmiSetBrightness(100, 0)
-                        return "☀ Brightness set to maximum (100%)"
-                        
-                    elif action == "MINIMUM":
-                        brightness_methods.WmiSetBrightness(0, 0)
-                        return "🔅 Brightness set to minimum (0%)"
-                        
-            except ImportError:
-                # Fallback using PowerShell
-                if action == "INCREASE":
-                    subprocess.run(["powershell", "-command", "(Get-WmiObject -Namespace root/WMI -Class WmiMonitorBrightnessMethods).WmiSetBrightness(1,10)"], 
-                                 capture_output=True)
-                    return "☀ Brightness increased"
-                    
-                elif action == "DECREASE":
-                    subprocess.run(["powershell", "-command", "(Get-WmiObject -Namespace root/WMI -Class WmiMonitorBrightnessMethods).WmiSetBrightness(1,-10)"], 
-                                 capture_output=True)
-                    return "🔆 Brightness decreased"
-                    
-                elif action == "SET" and level is not None:
-                    subprocess.run(["powershell", "-command", f"(Get-WmiObject -Namespace root/WMI -Class WmiMonitorBrightnessMethods).WmiSetBrightness(1,{level})"], 
-                                 capture_output=True)
-                    return f"☀ Brightness set to {level}%"
-                    
-                elif action == "MAXIMUM":
-                    subprocess.run(["powershell", "-command", "(Get-WmiObject -Namespace root/WMI -Class WmiMonitorBrightnessMethods).WmiSetBrightness(1,100)"], 
-                                 capture_output=True)
-                    return "☀ Brightness set to maximum (100%)"
-                    
-                elif action == "MINIMUM":
-                    subprocess.run(["powershell", "-command", "(Get-WmiObject -Namespace root/WMI -Class WmiMonitorBrightnessMethods).WmiSetBrightness(1,0)"], 
-                                 capture_output=True)
-                    return "🔅 Brightness set to minimum (0%)"
-                
-        elif system == "Darwin":  # macOS
-            if action == "INCREASE":
-                os.system("brightness -i 10")
-                return "☀ Brightness increased"
-                
-            elif action == "DECREASE":
-                os.system("brightness -d 10")
-                return "🔆 Brightness decreased"
-                
-            elif action == "SET" and level is not None:
-                level_float = float(level) / 100.0
-                os.system(f"brightness {level_float}")
-                return f"☀ Brightness set to {level}%"
-                
-            elif action == "MAXIMUM":
-                os.system("brightness 1")
-                return "☀ Brightness set to maximum (100%)"
-                
-            elif action == "MINIMUM":
-                os.system("brightness 0")
-                return "🔅 Brightness set to minimum (0%)"
-                
-        elif system == "Linux":
-            try:
-                # Find the first backlight device
-                backlight_dir = "/sys/class/backlight/"
-                devices = os.listdir(backlight_dir)
-                
-                if devices:
-                    device = devices[0]
-                    max_brightness_file = f"{backlight_dir}{device}/max_brightness"
-                    brightness_file = f"{backlight_dir}{device}/brightness"
-                    
-                    with open(max_brightness_file, 'r') as f:
-                        max_brightness = int(f.read().strip())
-                        
-                    with open(brightness_file, 'r') as f:
-                        current_brightness = int(f.read().strip())
-                        
-                    current_percent = (current_brightness / max_brightness) * 100
-                    
-                    if action == "INCREASE":
-                        new_percent = min(100, current_percent + 10)
-                        new_brightness = int((new_percent / 100) * max_brightness)
-                        with open(brightness_file, 'w') as f:
-                            f.write(str(new_brightness))
-                        return f"☀ Brightness increased to {int(new_percent)}%"
-                        
-                    elif action == "DECREASE":
-                        new_percent = max(0, current_percent - 10)
-                        new_brightness = int((new_percent / 100) * max_brightness)
-                        with open(brightness_file, 'w') as f:
-                            f.write(str(new_brightness))
-                        return f"🔆 Brightness decreased to {int(new_percent)}%"
-                        
-                    elif action == "SET" and level is not None:
-                        new_brightness = int((float(level) / 100) * max_brightness)
-                        with open(brightness_file, 'w') as f:
-                            f.write(str(new_brightness))
-                        return f"☀ Brightness set to {level}%"
-                        
-                    elif action == "MAXIMUM":
-                        with open(brightness_file, 'w') as f:
-                            f.write(str(max_brightness))
-                        return "☀ Brightness set to maximum (100%)"
-                        
-                    elif action == "MINIMUM":
-                        with open(brightness_file, 'w') as f:
-                            f.write("0")
-                        return "🔅 Brightness set to minimum (0%)"
-            except Exception as e:
-                # Fallback for Linux using xbacklight
-                if action == "INCREASE":
-                    os.system("xbacklight -inc 10")
-                    return "☀ Brightness increased"
-                    
-                elif action == "DECREASE":
-                    os.system("xbacklight -dec 10")
-                    return "🔆 Brightness decreased"
-                    
-                elif action == "SET" and level is not None:
-                    os.system(f"xbacklight -set {level}")
-                    return f"☀ Brightness set to {level}%"
-                    
-                elif action == "MAXIMUM":
-                    os.system("xbacklight -set 100")
-                    return "☀ Brightness set to maximum (100%)"
-                    
-                elif action == "MINIMUM":
-                    os.system("xbacklight -set 0")
-                    return "🔅 Brightness set to minimum (0%)"
+        if action == "INCREASE":
+            new_level = brightness_adjuster.adjust(10)
+            return f"☀ Brightness increased to {int(new_level)}%" if new_level is not None else "☀ Brightness increased"
+            
+        elif action == "DECREASE":
+            new_level = brightness_adjuster.adjust(-10)
+            return f"🔆 Brightness decreased to {int(new_level)}%" if new_level is not None else "🔆 Brightness decreased"
+            
+        elif action == "SET" and level is not None:
+            new_level = brightness_adjuster.set_level(level)
+            return f"☀ Brightness set to {int(new_level)}%"
+            
+        elif action == "MAXIMUM":
+            brightness_adjuster.set_level(100)
+            return "☀ Brightness set to maximum (100%)"
+            
+        elif action == "MINIMUM":
+            brightness_adjuster.set_level(0)
+            return "🔅 Brightness set to minimum (0%)"
                     
         return "⚠ Brightness control not implemented for your operating system."
         
+    except NotImplementedError:
+        return "⚠ Brightness control not implemented for your operating system."
     except Exception as e:
         return f"⚠ Error controlling brightness: {e}"
 
-def interpret_command(command):
-    """Analyzes the Gemini-processed command and performs operations."""
+class ProgressReporter:
+    """Counts files and bytes processed by a long-running operation and reports them periodically."""
+
+    def __init__(self, callback, operation, interval=0.25):
+        self.callback = callback
+        self.operation = operation
+        self.interval = interval
+        self.files = 0
+        self.bytes = 0
+        self.last_report = 0.0
+        self.lock = threading.Lock()
+
+    def advance(self, files=1, size=0):
+        with self.lock:
+            self.files += files
+            self.bytes += size
+            now = time.monotonic()
+            if now - self.last_report < self.interval:
+                return
+            self.last_report = now
+            event = {"operation": self.operation, "files": self.files, "bytes": self.bytes}
+        self.callback(event)
+
+    def finish(self):
+        with self.lock:
+            event = {"operation": self.operation, "files": self.files, "bytes": self.bytes, "done": True}
+        self.callback(event)
+
+def remove_tree(path, reporter=None):
+    """Deletes a folder bottom-up, reporting each removed file."""
+    if reporter is None:
+        shutil.rmtree(path)
+        return
+    for root, dirs, files in os.walk(path, topdown=False):
+        for name in files:
+            filepath = os.path.join(root, name)
+            size = os.lstat(filepath).st_size
+            os.remove(filepath)
+            reporter.advance(size=size)
+        for name in dirs:
+            dirpath = os.path.join(root, name)
+            if os.path.islink(dirpath):
+                os.remove(dirpath)
+            else:
+                os.rmdir(dirpath)
+    os.rmdir(path)
+    reporter.finish()
+
+# Transfer engine for moves that cross filesystems
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+COPY_WORKERS = config.get("copy_workers", min(8, (os.cpu_count() or 2) * 2))
+
+def copy_file_contents(src, dst, reporter=None):
+    """Copies file data using copy_file_range/sendfile when available, else large buffered reads."""
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        copied = 0
+        for kernel_copy in (getattr(os, "copy_file_range", None), getattr(os, "sendfile", None)):
+            if kernel_copy is None or copied:
+                continue
+            try:
+                while copied < size:
+                    if kernel_copy is os.sendfile:
+                        sent = os.sendfile(fdst.fileno(), fsrc.fileno(), copied, min(COPY_BUFFER_SIZE, size - copied))
+                    else:
+                        sent = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(COPY_BUFFER_SIZE, size - copied), copied, copied)
+                    if sent == 0:
+                        break
+                    copied += sent
+                    if reporter:
+                        reporter.advance(files=0, size=sent)
+                if copied >= size:
+                    return copied
+            except OSError as e:
+                # Unsupported by this filesystem pair; fall through if nothing was written yet
+                if copied or e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.ENOTSOCK):
+                    raise
+
+        fsrc.seek(copied)
+        fdst.seek(copied)
+        buffer = bytearray(min(COPY_BUFFER_SIZE, max(size - copied, 1)))
+        view = memoryview(buffer)
+        while True:
+            read = fsrc.readinto(buffer)
+            if not read:
+                break
+            fdst.write(view[:read])
+            copied += read
+            if reporter:
+                reporter.advance(files=0, size=read)
+        return copied
+
+def _copy_verified(src, dst, reporter=None):
+    copy_file_contents(src, dst, reporter)
+    shutil.copystat(src, dst)
+    if os.stat(dst).st_size != os.stat(src).st_size:
+        raise OSError(f"Copy verification failed for {src}")
+    if reporter:
+        reporter.advance(files=1)
+
+def _scan_tree(root):
+    """Walks a tree once with os.scandir, returning its directories, files and symlinks."""
+    directories, files, links = [], [], []
+    pending = [""]
+    while pending:
+        relative = pending.pop()
+        with os.scandir(os.path.join(root, relative)) as entries:
+            for entry in entries:
+                entry_relative = os.path.join(relative, entry.name)
+                if entry.is_symlink():
+                    links.append(entry_relative)
+                elif entry.is_dir():
+                    directories.append(entry_relative)
+                    pending.append(entry_relative)
+                else:
+                    files.append(entry_relative)
+    return directories, files, links
+
+def transfer_tree(src_path, dest_path, reporter=None):
+    """Copies a file or folder to another filesystem in parallel, then deletes the verified source."""
+    if not os.path.isdir(src_path) or os.path.islink(src_path):
+        try:
+            _copy_verified(src_path, dest_path, reporter)
+        except BaseException:
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+            raise
+        os.remove(src_path)
+        return
+
+    directories, files, links = _scan_tree(src_path)
+    os.makedirs(dest_path)
+    try:
+        for relative in directories:
+            os.makedirs(os.path.join(dest_path, relative), exist_ok=True)
+        for relative in links:
+            os.symlink(os.readlink(os.path.join(src_path, relative)), os.path.join(dest_path, relative))
+
+        with ThreadPoolExecutor(max_workers=COPY_WORKERS) as executor:
+            copies = [executor.submit(_copy_verified, os.path.join(src_path, relative),
+                                      os.path.join(dest_path, relative), reporter) for relative in files]
+            for copy in copies:
+                copy.result()
+
+        # Directory timestamps are restored last, deepest first, since copying into them updates mtime
+        for relative in sorted(directories, key=lambda path: path.count(os.sep), reverse=True) + [""]:
+            shutil.copystat(os.path.join(src_path, relative), os.path.join(dest_path, relative))
+    except BaseException:
+        shutil.rmtree(dest_path, ignore_errors=True)
+        raise
+
+    shutil.rmtree(src_path)
+
+def move_path(src_path, dest_path, reporter=None):
+    """Moves a file or folder, using the parallel transfer engine when it crosses devices.
+
+    Returns the final path, which is inside dest_path when that is an existing folder.
+    """
+    if os.path.isdir(dest_path) and not os.path.islink(dest_path):
+        dest_path = os.path.join(dest_path, os.path.basename(os.path.normpath(src_path)))
+        if os.path.exists(dest_path):
+            raise FileExistsError(f"Destination path '{dest_path}' already exists")
+
+    try:
+        if os.path.isdir(src_path) and not os.path.islink(src_path):
+            os.rename(src_path, dest_path)
+        else:
+            # Like shutil.move, a file replaces an existing destination file on every platform
+            os.replace(src_path, dest_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        transfer_tree(src_path, dest_path, reporter)
+
+    if reporter:
+        reporter.finish()
+    return dest_path
+
+# File-name index so commands can name a file ("delete report.txt") without its directory
+INOTIFY_MASK = 0x100 | 0x200 | 0x40 | 0x80 | 0x400 | 0x800  # CREATE, DELETE, MOVED_FROM, MOVED_TO, DELETE_SELF, MOVE_SELF
+IN_ISDIR = 0x40000000
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+INDEX_FILE_HEADER = "ULTRON-INDEX 1"
+
+class InotifyWatcher:
+    """Minimal ctypes binding to Linux inotify; raises OSError where it isn't available."""
+
+    def __init__(self):
+        if platform.system() != "Linux":
+            raise OSError("inotify is only available on Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(0o2000000)  # IN_CLOEXEC
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}  # watch descriptor -> directory
+
+    def add(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {directory}")
+        self.watches[wd] = directory
+
+    def read_events(self):
+        """Blocks until events arrive; yields (directory, name, mask) tuples."""
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, _cookie, length = struct.unpack_from("iIII", data, offset)
+            name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b"\0"))
+            offset += 16 + length
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            yield self.watches.get(wd), name, mask
+
+    def close(self):
+        """Closes the inotify descriptor, which releases every watch it holds."""
+        os.close(self.fd)
+        self.watches.clear()
+
+class FileIndex:
+    """Maps lower-cased file and folder names to full paths under a set of root folders.
+
+    Built with a parallel directory walk, persisted as a gzip file with one
+    line per directory, and kept fresh with inotify on Linux or by polling
+    directory modification times elsewhere.
+    """
+
+    def __init__(self, roots, path, workers=8, poll_seconds=30):
+        self.roots = [os.path.abspath(root) for root in roots if os.path.isdir(root)]
+        self.path = path
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.directories = {}  # directory -> (mtime, set of entry names)
+        self.names = {}  # lower-cased name -> set of full paths
+        self.lock = threading.RLock()
+        self.ready = threading.Event()
+        self.dirty = False
+        self.mode = "idle"
+        self.watcher = None
+
+    # Index maintenance
+
+    def _add_entry(self, directory, name):
+        self.names.setdefault(name.lower(), set()).add(os.path.join(directory, name))
+
+    def _remove_entry(self, directory, name):
+        paths = self.names.get(name.lower())
+        if paths is not None:
+            paths.discard(os.path.join(directory, name))
+            if not paths:
+                del self.names[name.lower()]
+
+    def _set_listing(self, directory, mtime, entries):
+        with self.lock:
+            _, previous = self.directories.get(directory, (None, set()))
+            for name in previous - entries:
+                self._remove_entry(directory, name)
+            for name in entries - previous:
+                self._add_entry(directory, name)
+            self.directories[directory] = (mtime, entries)
+            self.dirty = True
+
+    def _forget_tree(self, directory):
+        with self.lock:
+            prefix = directory.rstrip(os.sep) + os.sep
+            for known in [d for d in self.directories if d == directory or d.startswith(prefix)]:
+                _, entries = self.directories.pop(known)
+                for name in entries:
+                    self._remove_entry(known, name)
+            self.dirty = True
+
+    def _scan_directory(self, directory):
+        """Lists one directory, updating the index; returns its subdirectories."""
+        try:
+            mtime = os.stat(directory).st_mtime
+            entries, subdirectories = set(), []
+            with os.scandir(directory) as listing:
+                for entry in listing:
+                    if "\t" in entry.name or "\n" in entry.name:
+                        continue
+                    entries.add(entry.name)
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirectories.append(entry.path)
+        except OSError:
+            self._forget_tree(directory)
+            return []
+        self._set_listing(directory, mtime, entries)
+        watcher = self.watcher
+        if watcher is not None:
+            try:
+                watcher.add(directory)
+            except OSError:
+                # Out of inotify watches: fall back to polling for freshness
+                self._stop_watching()
+        return subdirectories
+
+    def _walk(self, directories):
+        """Scans directories and everything below them on a thread pool."""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            running = {executor.submit(self._scan_directory, directory) for directory in directories}
+            while running:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for subdirectory in future.result():
+                        running.add(executor.submit(self._scan_directory, subdirectory))
+
+    def refresh_changed(self):
+        """Rescans only directories whose modification time changed since they were indexed."""
+        with self.lock:
+            known = list(self.directories.items())
+
+        def changed(item):
+            directory, (mtime, _) = item
+            try:
+                return directory if os.stat(directory).st_mtime != mtime else None
+            except OSError:
+                return directory
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            stale = [directory for directory in executor.map(changed, known) if directory]
+        for directory in stale:
+            for subdirectory in self._scan_directory(directory):
+                if subdirectory not in self.directories:
+                    self._walk([subdirectory])
+        return len(stale)
+
+    # Persistence
+
+    def load(self):
+        try:
+            with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+                if f.readline().rstrip("\n") != INDEX_FILE_HEADER:
+                    return False
+                for line in f:
+                    directory, mtime, *entries = line.rstrip("\n").split("\t")
+                    self._set_listing(directory, float(mtime), set(entries))
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, EOFError) as e:
+            print(f"⚠ Ignoring unreadable file index: {e}")
+            with self.lock:
+                self.directories, self.names = {}, {}
+            return False
+        with self.lock:
+            # Drop directories that are no longer under a configured root
+            for directory in list(self.directories):
+                if not any(_paths_overlap(_path_key(directory), _path_key(root)) for root in self.roots):
+                    self._forget_tree(directory)
+        return True
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            lines = [f"{directory}\t{mtime}\t" + "\t".join(sorted(entries))
+                     for directory, (mtime, entries) in self.directories.items()]
+            self.dirty = False
+        temp_path = f"{self.path}.tmp"
+        try:
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+                f.write(INDEX_FILE_HEADER + "\n")
+                f.write("\n".join(lines) + "\n")
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"⚠ Could not save file index: {e}")
+
+    # Background freshness
+
+    def _stop_watching(self):
+        """Switches to polling and closes the watcher, so its watches stop counting against the limit."""
+        with self.lock:
+            watcher, self.watcher = self.watcher, None
+            self.mode = "polling"
+        if watcher is not None:
+            watcher.close()
+
+    def _watch_loop(self):
+        while self.watcher is not None:
+            try:
+                events = list(self.watcher.read_events())
+            except OSError:
+                break
+            for directory, name, mask in events:
+                if mask & IN_Q_OVERFLOW:
+                    self.refresh_changed()
+                    continue
+                if directory is None:
+                    continue
+                path = os.path.join(directory, name) if name else directory
+                if mask & (0x200 | 0x40):  # DELETE, MOVED_FROM
+                    with self.lock:
+                        self._remove_entry(directory, name)
+                        entries = self.directories.get(directory, (0, set()))[1]
+                        entries.discard(name)
+                        self.dirty = True
+                    if mask & IN_ISDIR:
+                        self._forget_tree(path)
+                elif mask & (0x100 | 0x80):  # CREATE, MOVED_TO
+                    with self.lock:
+                        self._add_entry(directory, name)
+                        self.directories.get(directory, (0, set()))[1].add(name)
+                        self.dirty = True
+                    if mask & IN_ISDIR:
+                        self._walk([path])
+                elif mask & (0x400 | 0x800) and not name:  # watched directory itself went away
+                    self._forget_tree(directory)
+        self._stop_watching()
+        self._poll_loop()
+
+    def _poll_loop(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            self.refresh_changed()
+            self.save()
+
+    def start(self):
+        """Loads or builds the index in a background thread and keeps it fresh."""
+        def run():
+            try:
+                self.watcher = InotifyWatcher()
+                self.mode = "inotify"
+            except OSError:
+                self.mode = "polling"
+            started = time.perf_counter()
+            if self.load():
+                # Watch the known folders first so nothing changes unseen while catching up
+                for directory in list(self.directories):
+                    if self.watcher is None:
+                        break
+                    try:
+                        self.watcher.add(directory)
+                    except OSError:
+                        self._stop_watching()
+                self.refresh_changed()
+            else:
+                self._walk(self.roots)
+            self.save()
+            self.ready.set()
+            print(f"🗂 Indexed {len(self.names)} names in {len(self.directories)} folders "
+                  f"in {time.perf_counter() - started:.2f}s ({self.mode})")
+            if self.watcher is not None:
+                self._watch_loop()
+            else:
+                self._poll_loop()
+
+        if self.roots:
+            threading.Thread(target=run, daemon=True, name="file-index").start()
+
+    # Lookups
+
+    def lookup(self, name):
+        """Returns every indexed path whose final component matches name (case-insensitive)."""
+        with self.lock:
+            return sorted(self.names.get(name.lower(), ()))
+
+    def stats(self):
+        with self.lock:
+            return {
+                "roots": self.roots,
+                "mode": self.mode,
+                "ready": self.ready.is_set(),
+                "names": len(self.names),
+                "directories": len(self.directories),
+            }
+
+with startup_step("file_index"):
+    file_index = FileIndex(
+        config.get("index_roots", []) + list(config.get("favorite_locations", {}).values()),
+        os.path.join(BASE_DIR, config.get("file_index_file", "file_index.gz")),
+        workers=config.get("file_index_workers", 8),
+        poll_seconds=config.get("file_index_poll_seconds", 30),
+    )
+atexit.register(file_index.save)
+
+def resolve_existing_path(path, exists=os.path.exists):
+    """Resolves a bare file or folder name through the file index when it isn't in the current folder.
+
+    Returns the resolved path, or raises LookupError when the name is ambiguous.
+    """
+    if os.path.dirname(path) or ntpath.dirname(path) or exists(path):
+        return path
+    matches = [match for match in file_index.lookup(path) if exists(match)]
+    if len(matches) > 1:
+        shown = ", ".join(matches[:5]) + (" ..." if len(matches) > 5 else "")
+        raise LookupError(f"'{path}' matches {len(matches)} locations: {shown}")
+    return matches[0] if matches else path
+
+# Undo journal: destructive file operations keep what they replace in a trash
+# folder on the same filesystem, so deleting is a rename and undo is a rename back.
+FICLONE = 0x40049409
+
+def _nearest_existing(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+def _mount_point(path):
+    path = _nearest_existing(path)
+    while not os.path.ismount(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+def snapshot_file(path, backup_path):
+    """Backs a file up as a hardlink, a reflink clone, or (last resort) a copy."""
+    try:
+        os.link(path, backup_path)
+        return "hardlink"
+    except OSError:
+        pass
+    try:
+        import fcntl
+        with open(path, 'rb') as src, open(backup_path, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        shutil.copystat(path, backup_path)
+        return "reflink"
+    except (ImportError, OSError):
+        if os.path.exists(backup_path):
+            os.remove(backup_path)
+    shutil.copy2(path, backup_path)
+    return "copy"
+
+class OperationJournal:
+    """Records how to reverse each file operation and replays it on undo."""
+
+    def __init__(self, path, backup_directory=None, enabled=True, max_entries=200):
+        self.path = path
+        self.backup_directory = backup_directory
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.entries = []
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if "undone" in record:
+                        self.entries = [entry for entry in self.entries if entry["id"] != record["undone"]]
+                    else:
+                        self.entries.append(record)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"⚠ Ignoring unreadable operation journal: {e}")
+            return
+        self.entries = self.entries[-self.max_entries:]
+        self._rewrite()
+
+    def _rewrite(self):
+        """Compacts the journal file down to the entries that can still be undone."""
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in self.entries)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"⚠ Could not compact operation journal: {e}")
+
+    def _write(self, record):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def trash_directory_for(self, path):
+        """Picks a trash folder on the same filesystem as path so moving into it is a rename."""
+        device = os.stat(_nearest_existing(path)).st_dev
+        if self.backup_directory and os.path.isabs(self.backup_directory):
+            try:
+                if os.stat(_nearest_existing(self.backup_directory)).st_dev == device:
+                    return os.path.join(self.backup_directory, "trash")
+            except OSError:
+                pass
+        return os.path.join(_mount_point(path), ".ultron_trash")
+
+    def trash_slot(self, path):
+        """Creates an empty trash folder on the same filesystem as path and returns it."""
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        candidates = [self.trash_directory_for(path), os.path.join(os.path.expanduser("~"), ".ultron_trash")]
+        for index, trash_directory in enumerate(candidates):
+            try:
+                slot = os.path.join(trash_directory, name)
+                os.makedirs(slot)
+                return slot
+            except OSError:
+                # The filesystem root may not be writable; the home folder is the last resort
+                if index == len(candidates) - 1:
+                    raise
+
+    def _new_slot(self, path):
+        return os.path.join(self.trash_slot(path), os.path.basename(os.path.normpath(path)))
+
+    def trash(self, path):
+        """Moves a file or folder into the trash and returns where it went."""
+        trashed = self._new_slot(path)
+        try:
+            os.rename(path, trashed)
+        except OSError:
+            # No writable trash on this filesystem: fall back to copying it away
+            move_path(path, trashed)
+        return trashed
+
+    def snapshot(self, path):
+        """Keeps a cheap backup of a file that is about to be replaced."""
+        backup = self._new_slot(path)
+        snapshot_file(path, backup)
+        return backup
+
+    def record(self, operation, description, undo):
+        """Stores the actions that reverse an operation, in the order they should run."""
+        entry = {"id": uuid.uuid4().hex, "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                 "operation": operation, "description": description, "undo": undo}
+        with self.lock:
+            self.entries.append(entry)
+            expired = self.entries[:-self.max_entries]
+            self.entries = self.entries[-self.max_entries:]
+            self._write(entry)
+        for old_entry in expired:
+            self._discard_backups(old_entry)
+
+    @staticmethod
+    def _discard_backups(entry):
+        for action in entry["undo"]:
+            if action["type"] == "restore":
+                shutil.rmtree(os.path.dirname(action["backup"]), ignore_errors=True)
+            elif action["type"] == "discard":
+                shutil.rmtree(action["path"], ignore_errors=True)
+
+    @staticmethod
+    def _find_conflict(actions):
+        """Replays an entry's undo actions on paper so a conflict is found before anything is changed."""
+        freed, taken = set(), set()
+        for action in actions:
+            if action["type"] == "remove":
+                freed.add(action["path"])
+                taken.discard(action["path"])
+            elif action["type"] in ("move", "restore"):
+                source, target = (action["from"], action["to"]) if action["type"] == "move" else (action["backup"], action["path"])
+                if target in taken or (os.path.exists(target) and target not in freed):
+                    return f"⚠ Cannot undo: '{target}' already exists."
+                if source in freed or not (source in taken or os.path.exists(source)):
+                    return f"⚠ Cannot undo: '{source}' no longer exists."
+                freed.add(source)
+                taken.discard(source)
+                taken.add(target)
+                freed.discard(target)
+        return None
+
+    def _apply(self, action):
+        if action["type"] == "remove":
+            # Undoing a create moves the file or folder out of the way in one rename, then deletes its
+            # trash slot: the entry is popped right after, so nothing could ever restore it
+            if os.path.exists(action["path"]):
+                trashed = self.trash(action["path"])
+                shutil.rmtree(os.path.dirname(trashed), ignore_errors=True)
+        elif action["type"] == "move":
+            move_path(action["from"], action["to"])
+        elif action["type"] == "restore":
+            os.rename(action["backup"], action["path"])
+            try:
+                os.rmdir(os.path.dirname(action["backup"]))
+            except OSError:
+                # Bulk deletes share one trash folder, removed by their final discard action
+                pass
+        elif action["type"] == "discard":
+            shutil.rmtree(action["path"], ignore_errors=True)
+
+    def undo(self):
+        """Reverses the most recent operation; returns a user-facing message."""
+        with self.lock:
+            if not self.entries:
+                return "⚠ Nothing to undo."
+            entry = self.entries[-1]
+            conflict = self._find_conflict(entry["undo"])
+            if conflict:
+                return conflict
+            actions = entry["undo"]
+            for index, action in enumerate(actions):
+                try:
+                    self._apply(action)
+                except Exception:
+                    # Keep only what is still left to undo, so retrying doesn't redo finished steps
+                    entry["undo"] = actions[index:]
+                    self._rewrite()
+                    raise
+            self.entries.pop()
+            self._write({"undone": entry["id"]})
+        return f"↩ Undid: {entry['description']}"
+
+    def history(self):
+        with self.lock:
+            return [{key: entry[key] for key in ("id", "timestamp", "operation", "description")}
+                    for entry in reversed(self.entries)]
+
+with startup_step("journal"):
+    operation_journal = OperationJournal(
+        os.path.join(BASE_DIR, config.get("journal_file", "operation_journal.jsonl")),
+        backup_directory=config.get("backup_directory"),
+        enabled=config.get("create_backups", True),
+        max_entries=config.get("journal_max_entries", 200),
+    )
+
+# Per-plan metadata cache: steps of one plan, batch or bulk operation share
+# what they learn about the filesystem, and update it with their own writes,
+# so repeated existence checks and parent-folder creation cost no syscalls.
+class PlanStatCache:
+    """Memoizes stat() results and created folders for the duration of one plan.
+
+    Only writes made through note_created/note_removed/ensure_directory keep it
+    accurate, so an instance must not outlive the plan that owns it.
+    """
+
+    def __init__(self):
+        self.kinds = {}  # absolute path -> "file", "dir", "other" or None when missing
+        self.listings = {}  # absolute folder path -> set of entry names, when fully known
+        self.ensured = set()
+        self.syscalls = 0
+        self.saved = 0
+        self.lock = threading.Lock()
+
+    def _cached_kind(self, key):
+        """Returns (known, kind) from what the cache has seen, without touching the disk."""
+        if key in self.kinds:
+            return True, self.kinds[key]
+        parent, name = os.path.split(key)
+        if parent != key and self.kinds.get(parent, "dir") is None:
+            return True, None
+        listing = self.listings.get(parent)
+        if listing is not None and name not in listing:
+            return True, None
+        return False, None
+
+    def kind(self, path):
+        key = os.path.abspath(path)
+        with self.lock:
+            known, kind = self._cached_kind(key)
+            if known:
+                self.saved += 1
+                return kind
+        try:
+            mode = os.stat(key).st_mode
+            kind = "dir" if stat.S_ISDIR(mode) else "file" if stat.S_ISREG(mode) else "other"
+        except OSError:
+            kind = None
+        with self.lock:
+            self.syscalls += 1
+            self.kinds[key] = kind
+        return kind
+
+    def exists(self, path):
+        return self.kind(path) is not None
+
+    def isdir(self, path):
+        return self.kind(path) == "dir"
+
+    def isfile(self, path):
+        return self.kind(path) == "file"
+
+    def list_directory(self, directory):
+        """Lists a folder once so later existence checks inside it are answered from memory."""
+        key = os.path.abspath(directory)
+        with self.lock:
+            if key in self.listings:
+                return
+        try:
+            with os.scandir(key) as entries:
+                kinds = {entry.name: "dir" if entry.is_dir() else "file" if entry.is_file() else "other" for entry in entries}
+        except OSError:
+            with self.lock:
+                self.syscalls += 1
+                self.kinds.setdefault(key, None)
+            return
+        with self.lock:
+            self.syscalls += 1
+            self.kinds[key] = "dir"
+            self.listings.setdefault(key, set()).update(kinds)
+            for name, kind in kinds.items():
+                self.kinds.setdefault(os.path.join(key, name), kind)
+
+    def ensure_directory(self, directory):
+        """Creates a folder and its parents unless this plan already knows it exists."""
+        if not directory:
+            return
+        key = os.path.abspath(directory)
+        with self.lock:
+            if key in self.ensured:
+                self.saved += 1
+                return
+        created = not self.isdir(key)
+        if created:
+            os.makedirs(key, exist_ok=True)
+        with self.lock:
+            if created:
+                self.syscalls += 1
+                # A folder makedirs just made is empty, so its listing is known
+                self.listings.setdefault(key, set())
+            # Every parent of an existing folder exists too
+            while os.path.dirname(key) != key:
+                parent, name = os.path.split(key)
+                self.kinds[key] = "dir"
+                self.ensured.add(key)
+                if parent in self.listings:
+                    self.listings[parent].add(name)
+                key = parent
+
+    def note_created(self, path, kind="file"):
+        key = os.path.abspath(path)
+        with self.lock:
+            self.kinds[key] = kind
+            parent, name = os.path.split(key)
+            if parent in self.listings:
+                self.listings[parent].add(name)
+
+    def note_removed(self, path, is_dir=True):
+        """Forgets a removed path, and everything under it unless it was known to be a file."""
+        key = os.path.abspath(path)
+        with self.lock:
+            if is_dir:
+                prefix = key.rstrip(os.sep) + os.sep
+                for cache in (self.kinds, self.listings):
+                    for known in [known for known in cache if known.startswith(prefix)]:
+                        del cache[known]
+                self.ensured = {known for known in self.ensured if known != key and not known.startswith(prefix)}
+                self.listings.pop(key, None)
+            self.kinds[key] = None
+            parent, name = os.path.split(key)
+            if parent in self.listings:
+                self.listings[parent].discard(name)
+
+    def publish(self):
+        """Adds the syscalls this cache saved to the metrics counter."""
+        with self.lock:
+            saved, self.saved = self.saved, 0
+        metrics.inc("ultron_stat_syscalls_saved_total", saved)
+        return saved
+
+metrics.describe("ultron_stat_syscalls_saved_total", "counter", "Filesystem metadata syscalls avoided by per-plan stat caches.")
+
+# Bulk operations apply one operation to every file matching a glob pattern:
+#   DELETE ALL [RECURSIVE] *.tmp IN D:\Work
+#   MOVE ALL [RECURSIVE] *.pdf FROM C:\Downloads TO C:\Documents\Papers
+#   RENAME ALL [RECURSIVE] *.jpg IN D:\Photos TO trip_###.jpg
+# Matches come from a single scandir walk and are processed on a bounded thread pool.
+BULK_WORKERS = config.get("bulk_workers", 8)
+BULK_PREVIEW_LIMIT = 50
+BULK_COMMAND_PATTERN = re.compile(
+    r"^(DELETE|MOVE|RENAME)\s+ALL\s+(RECURSIVE\s+)?(\S+)\s+(?:IN|FROM)\s+(.+?)(?:\s+TO\s+(.+))?$", re.IGNORECASE)
+
+metrics.describe("ultron_bulk_items_total", "counter", "Files processed by bulk operations, by operation and status.")
+
+def parse_bulk_command(command):
+    """Parses "DELETE/MOVE/RENAME ALL ..." into an operation dictionary, or returns None."""
+    match = BULK_COMMAND_PATTERN.match(command.strip())
+    if not match:
+        return None
+    operation, recursive, pattern, directory, target = match.groups()
+    operation = operation.upper()
+    if (operation == "DELETE") != (target is None):
+        return None
+    op = {"operation": operation, "object": "ALL", "pattern": pattern,
+          "directory": directory.strip(), "recursive": bool(recursive)}
+    if operation == "MOVE":
+        op["destination"] = target.strip()
+    elif operation == "RENAME":
+        op["template"] = target.strip()
+    return op
+
+def find_matches(directory, pattern, recursive=False):
+    """Returns sorted (relative path, size) pairs for files matching pattern.
+
+    The pattern is a case-insensitive glob; several can be given separated by commas.
+    """
+    regex = "|".join(fnmatch.translate(part.strip()) for part in pattern.split(",") if part.strip())
+    matcher = re.compile(regex, re.IGNORECASE).match
+    matches = []
+    pending = [""]
+    while pending:
+        relative = pending.pop()
+        with os.scandir(os.path.join(directory, relative)) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        pending.append(os.path.join(relative, entry.name))
+                elif matcher(entry.name):
+                    matches.append((os.path.join(relative, entry.name), entry.stat(follow_symlinks=False).st_size))
+    matches.sort()
+    return matches
+
+def _rename_targets(matches, template):
+    """Expands a template like trip_###.jpg into one zero-padded, numbered name per match."""
+    counter = re.search(r"#+", template)
+    if not counter:
+        raise ValueError(f"Rename template '{template}' needs a ### counter, like trip_###.jpg")
+    width = len(counter.group(0))
+    return [os.path.join(os.path.dirname(relative), f"{template[:counter.start()]}{number:0{width}d}{template[counter.end():]}")
+            for number, (relative, _) in enumerate(matches, 1)]
+
+def run_bulk_operation(op, dry_run=False, progress=None, stat_cache=None):
+    """Runs or previews a bulk operation.
+
+    Returns a summary dictionary with a user-facing "response", the match
+    count and either a preview or one result per matched file.
+    """
+    stats = stat_cache or PlanStatCache()
+    try:
+        return _run_bulk_operation(op, dry_run, progress, stats)
+    finally:
+        if stat_cache is None:
+            stats.publish()
+
+def _run_bulk_operation(op, dry_run, progress, stats):
+    directory = resolve_existing_path(op["directory"], stats.exists)
+    if not stats.isdir(directory):
+        return {"response": f"⚠ Folder does not exist: {directory}", "matched": 0}
+
+    matches = find_matches(directory, op["pattern"], op["recursive"])
+    sources = [os.path.join(directory, relative) for relative, _ in matches]
+    if op["operation"] == "RENAME":
+        targets = [os.path.join(directory, name) for name in _rename_targets(matches, op["template"])]
+    elif op["operation"] == "MOVE":
+        targets = [os.path.join(op["destination"], relative) for relative, _ in matches]
+    else:
+        targets = [None] * len(matches)
+
+    summary = {
+        "operation": op["operation"],
+        "pattern": op["pattern"],
+        "directory": directory,
+        "matched": len(matches),
+        "bytes": sum(size for _, size in matches),
+    }
+    if dry_run:
+        summary["preview"] = [{"source": source, "target": target}
+                              for source, target in zip(sources[:BULK_PREVIEW_LIMIT], targets[:BULK_PREVIEW_LIMIT])]
+        summary["response"] = f"🔎 {len(matches)} files match '{op['pattern']}' in {directory}."
+        return summary
+    if not matches:
+        summary["response"] = f"⚠ No files match '{op['pattern']}' in {directory}."
+        return summary
+
+    # Renames run in parallel, so no target may be a name another match still holds
+    clashes = sorted(set(sources) & set(targets))
+    if clashes:
+        summary["response"] = f"⚠ Rename targets clash with files being renamed: {', '.join(clashes[:5])}"
+        return summary
+
+    # One listing per target folder answers every "does the target exist" check
+    for parent in sorted({os.path.dirname(target) for target in targets if target}):
+        stats.list_directory(parent)
+    trash_slot = None
+    if op["operation"] == "DELETE" and operation_journal.enabled:
+        trash_slot = operation_journal.trash_slot(directory)
+        stats.note_created(trash_slot, "dir")
+    reporter = ProgressReporter(progress, op["operation"]) if progress else None
+
+    def process(index):
+        source, target = sources[index], targets[index]
+        relative, size = matches[index]
+        try:
+            if op["operation"] == "DELETE":
+                undo = None
+                if trash_slot:
+                    trashed = os.path.join(trash_slot, relative)
+                    stats.ensure_directory(os.path.dirname(trashed))
+                    move_path(source, trashed)
+                    undo = {"type": "restore", "backup": trashed, "path": os.path.abspath(source)}
+                else:
+                    os.remove(source)
+                stats.note_removed(source, is_dir=False)
+            else:
+                if stats.exists(target):
+                    raise FileExistsError(f"'{target}' already exists")
+                stats.ensure_directory(os.path.dirname(target))
+                if op["operation"] == "RENAME":
+                    os.rename(source, target)
+                    final_path = target
+                else:
+                    final_path = move_path(source, target)
+                stats.note_removed(source, is_dir=False)
+                stats.note_created(final_path)
+                undo = {"type": "move", "from": os.path.abspath(final_path), "to": os.path.abspath(source)}
+            if reporter:
+                reporter.advance(size=size)
+            return {"source": source, "target": target, "status": "ok"}, undo
+        except Exception as e:
+            return {"source": source, "target": target, "status": "error", "error": str(e)}, None
+
+    with ThreadPoolExecutor(max_workers=BULK_WORKERS) as executor:
+        outcomes = list(executor.map(process, range(len(matches))))
+    if reporter:
+        reporter.finish()
+
+    items = [item for item, _ in outcomes]
+    succeeded = sum(1 for item in items if item["status"] == "ok")
+    failed = len(items) - succeeded
+    metrics.inc("ultron_bulk_items_total", succeeded, operation=op["operation"], status="ok")
+    metrics.inc("ultron_bulk_items_total", failed, operation=op["operation"], status="error")
+
+    undo = [action for _, action in outcomes if action]
+    if trash_slot:
+        undo.append({"type": "discard", "path": trash_slot})
+    verb = {"DELETE": "deleted", "MOVE": "moved", "RENAME": "renamed"}[op["operation"]]
+    if operation_journal.enabled and succeeded:
+        operation_journal.record(op["operation"], f"{verb} {succeeded} files matching '{op['pattern']}' in '{directory}'", undo)
+    elif trash_slot:
+        shutil.rmtree(trash_slot, ignore_errors=True)
+
+    icon = {"DELETE": "🗑", "MOVE": "📂", "RENAME": "🔄"}[op["operation"]]
+    message = f"{verb.capitalize()} {succeeded} of {len(items)} files matching '{op['pattern']}' in {directory}"
+    if failed:
+        first_error = next(item for item in items if item["status"] == "error")
+        summary["response"] = f"⚠ {message}; {failed} failed (first: {first_error['error']})."
+    else:
+        summary["response"] = f"{icon} {message}."
+    summary.update(succeeded=succeeded, failed=failed, syscalls_saved=stats.saved, items=items)
+    return summary
+
+def parse_formatted_command(command):
+    """Parses a formatted command like "MOVE FILE FROM a TO b" into an operation dictionary.
+
+    Returns None when the command doesn't match the grammar.
+    """
+    parts = command.split()
+    operation = parts[0].upper() if parts else ""
+
+    # Bulk pattern operations ("DELETE ALL *.tmp IN D:\Work")
+    if len(parts) >= 2 and parts[1].upper() == "ALL":
+        return parse_bulk_command(command)
+
+    # Volume and brightness control commands
+    elif operation in ("VOLUME", "BRIGHTNESS"):
+        if len(parts) >= 2:
+            level = int(parts[2]) if len(parts) >= 3 else None
+            return {"operation": operation, "action": parts[1].upper(), "level": level}
+
+    # Navigation commands
+    elif operation == "NAVIGATE":
+        location_index = command.upper().find("TO ")
+        if location_index != -1:
+            return {"operation": operation, "path": command[location_index + 3:].strip()}
+
+    # File/folder creation and deletion
+    elif operation in ("CREATE", "DELETE"):
+        if len(parts) >= 2 and parts[1].upper() in ("FILE", "FOLDER"):
+            return {"operation": operation, "object": parts[1].upper(), "path": " ".join(parts[2:])}
+
+    # File/folder renaming and moving
+    elif operation in ("RENAME", "MOVE"):
+        if "FROM" in command.upper() and "TO" in command.upper():
+            from_index = command.upper().find("FROM ")
+            to_index = command.upper().find(" TO ")
+
+            if from_index != -1 and to_index != -1:
+                return {
+                    "operation": operation,
+                    "object": "FILE" if "FILE" in parts else "FOLDER",
+                    "source": command[from_index + 5:to_index].strip(),
+                    "destination": command[to_index + 4:].strip(),
+                }
+
+    return None
+
+def _snapshot_if_replaced(path, stats):
+    """Backs up a file that a rename or move is about to overwrite."""
+    if operation_journal.enabled and stats.isfile(path):
+        return operation_journal.snapshot(path)
+    return None
+
+def _record_relocation(operation, description, source, destination, backup):
+    if not operation_journal.enabled:
+        return
+    undo = [{"type": "move", "from": os.path.abspath(destination), "to": os.path.abspath(source)}]
+    if backup:
+        undo.append({"type": "restore", "backup": backup, "path": os.path.abspath(destination)})
+    operation_journal.record(operation, description, undo)
+
+def execute_operation(op, progress=None, stat_cache=None):
+    """Performs a parsed operation and returns the user-facing result message.
+
+    Steps of one plan pass the same stat_cache so they share metadata lookups.
+    """
+    stats = stat_cache or PlanStatCache()
+    try:
+        return _execute_operation(op, progress, stats)
+    finally:
+        if stat_cache is None:
+            stats.publish()
+
+def _execute_operation(op, progress, stats):
+    operation = op["operation"]
+
+    # Handle volume control commands
+    if operation == "VOLUME":
+        return control_volume(op["action"], op["level"])
+
+    # Handle brightness control commands
+    elif operation == "BRIGHTNESS":
+        return control_brightness(op["action"], op["level"])
+
+    # Handle bulk pattern operations
+    elif op.get("object") == "ALL":
+        return run_bulk_operation(op, progress=progress, stat_cache=stats)["response"]
+
+    # Handle navigation commands
+    elif operation == "NAVIGATE":
+        path = resolve_existing_path(op["path"], stats.exists)
+        if stats.exists(path):
+            os.chdir(path)
+            return f"📂 Changed directory to {path}"
+        else:
+            return f"⚠ Path does not exist: {path}"
+
+    # Handle file/folder creation
+    elif operation == "CREATE":
+        if op["object"] == "FILE":
+            filepath = op["path"]
+            stats.ensure_directory(os.path.dirname(filepath))
+            undo = [{"type": "remove", "path": os.path.abspath(filepath)}]
+            if operation_journal.enabled and stats.exists(filepath):
+                # Creating over an existing file truncates it, so keep the old one in the trash
+                undo.append({"type": "restore", "backup": operation_journal.trash(filepath), "path": os.path.abspath(filepath)})
+            open(filepath, 'w').close()
+            stats.note_created(filepath)
+            if operation_journal.enabled:
+                operation_journal.record("CREATE", f"created file '{filepath}'", undo)
+            return f"✅ File '{filepath}' created successfully."
+
+        else:
+            folderpath = op["path"]
+            existed = stats.exists(folderpath)
+            stats.ensure_directory(folderpath)
+            if operation_journal.enabled and not existed:
+                operation_journal.record("CREATE", f"created folder '{folderpath}'",
+                                         [{"type": "remove", "path": os.path.abspath(folderpath)}])
+            return f"📁 Folder '{folderpath}' created successfully."
+
+    # Handle file/folder deletion
+    elif operation == "DELETE":
+        if op["object"] == "FILE":
+            filepath = resolve_existing_path(op["path"], stats.exists)
+            if stats.exists(filepath):
+                if operation_journal.enabled:
+                    trashed = operation_journal.trash(filepath)
+                    operation_journal.record("DELETE", f"deleted file '{filepath}'",
+                                             [{"type": "restore", "backup": trashed, "path": os.path.abspath(filepath)}])
+                else:
+                    os.remove(filepath)
+                stats.note_removed(filepath, is_dir=False)
+                return f"🗑 File '{filepath}' deleted successfully."
+            else:
+                return f"⚠ File does not exist: {filepath}"
+
+        else:
+            folderpath = resolve_existing_path(op["path"], stats.exists)
+            if stats.exists(folderpath):
+                if operation_journal.enabled:
+                    trashed = operation_journal.trash(folderpath)
+                    operation_journal.record("DELETE", f"deleted folder '{folderpath}'",
+                                             [{"type": "restore", "backup": trashed, "path": os.path.abspath(folderpath)}])
+                else:
+                    remove_tree(folderpath, ProgressReporter(progress, "DELETE") if progress else None)
+                stats.note_removed(folderpath)
+                return f"🗑 Folder '{folderpath}' deleted successfully."
+            else:
+                return f"⚠ Folder does not exist: {folderpath}"
+
+    # Handle file/folder renaming
+    elif operation == "RENAME":
+        old_path, new_path = resolve_existing_path(op["source"], stats.exists), op["destination"]
+        if old_path != op["source"] and not (os.path.dirname(new_path) or ntpath.dirname(new_path)):
+            # A bare new name found through the index stays next to the original
+            new_path = os.path.join(os.path.dirname(old_path), new_path)
+        if stats.exists(old_path):
+            stats.ensure_directory(os.path.dirname(new_path))
+
+            backup = _snapshot_if_replaced(new_path, stats)
+            kind = stats.kind(old_path)
+            os.rename(old_path, new_path)
+            stats.note_removed(old_path, is_dir=kind != "file")
+            stats.note_removed(new_path, is_dir=kind != "file")
+            stats.note_created(new_path, kind)
+            _record_relocation("RENAME", f"renamed '{old_path}' to '{new_path}'", old_path, new_path, backup)
+
+            if op["object"] == "FILE":
+                return f"🔄 File renamed from '{old_path}' to '{new_path}'."
+            else:
+                return f"🔄 Folder renamed from '{old_path}' to '{new_path}'."
+        else:
+            return f"⚠ Source path does not exist: {old_path}"
+
+    # Handle file/folder moving
+    elif operation == "MOVE":
+        src_path, dest_path = resolve_existing_path(op["source"], stats.exists), op["destination"]
+        if stats.exists(src_path):
+            stats.ensure_directory(os.path.dirname(dest_path))
+
+            backup = _snapshot_if_replaced(dest_path, stats)
+            kind = stats.kind(src_path)
+            final_path = move_path(src_path, dest_path, ProgressReporter(progress, "MOVE") if progress else None)
+            stats.note_removed(src_path, is_dir=kind != "file")
+            stats.note_removed(final_path, is_dir=kind != "file")
+            stats.note_created(final_path, kind)
+            _record_relocation("MOVE", f"moved '{src_path}' to '{final_path}'", src_path, final_path, backup)
+
+            if op["object"] == "FILE":
+                return f"📂 File moved from '{src_path}' to '{dest_path}'."
+            else:
+                return f"📂 Folder moved from '{src_path}' to '{dest_path}'."
+        else:
+            return f"⚠ Source path does not exist: {src_path}"
+
+    return "⚠ Command not recognized or incorrectly formatted."
+
+def interpret_command(command, progress=None, stat_cache=None):
+    """Analyzes the Gemini-processed command and performs operations.
+
+    When a progress callback is given, long-running deletes and moves call it
+    with {"operation", "files", "bytes"} dictionaries as they advance.
+    """
     try:
         command = command.strip()
         print(f"🔍 Processed Command: {command}")
         
         if command == "UNKNOWN":
+            metrics.inc("ultron_operation_errors_total", operation="UNKNOWN")
             return "⚠ Command not recognized."
 
-        parts = command.split()
-        operation = parts[0].upper() if parts else ""
-        
-        # Handle volume control commands
-        if operation == "VOLUME":
-            if len(parts) >= 2:
-                action = parts[1].upper()
-                level = int(parts[2]) if len(parts) >= 3 else None
-                return control_volume(action, level)
-        
-        # Handle brightness control commands
-        elif operation == "BRIGHTNESS":
-            if len(parts) >= 2:
-                action = parts[1].upper()
-                level = int(parts[2]) if len(parts) >= 3 else None
-                return control_brightness(action, level)
-        
-        # Handle navigation commands
-        elif operation == "NAVIGATE":
-            location_index = command.upper().find("TO ")
-            if location_index != -1:
-                path = command[location_index + 3:].strip()
-                if os.path.exists(path):
-                    os.chdir(path)
-                    return f"📂 Changed directory to {path}"
-                else:
-                    return f"⚠ Path does not exist: {path}"
-        
-        # Handle file/folder creation
-        elif operation == "CREATE":
-            if len(parts) >= 2 and parts[1].upper() == "FILE":
-                filepath = " ".join(parts[2:])
-                directory = os.path.dirname(filepath)
-                if directory and not os.path.exists(directory):
-                    os.makedirs(directory, exist_ok=True)
-                open(filepath, 'w').close()
-                return f"✅ File '{filepath}' created successfully."
-            
-            elif len(parts) >= 2 and parts[1].upper() == "FOLDER":
-                folderpath = " ".join(parts[2:])
-                os.makedirs(folderpath, exist_ok=True)
-                return f"📁 Folder '{folderpath}' created successfully."
-        
-        # Handle file/folder deletion
-        elif operation == "DELETE":
-            if len(parts) >= 2 and parts[1].upper() == "FILE":
-                filepath = " ".join(parts[2:])
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                    return f"🗑 File '{filepath}' deleted successfully."
-                else:
-                    return f"⚠ File does not exist: {filepath}"
-            
-            elif len(parts) >= 2 and parts[1].upper() == "FOLDER":
-                folderpath = " ".join(parts[2:])
-                if os.path.exists(folderpath):
-                    shutil.rmtree(folderpath)
-                    return f"🗑 Folder '{folderpath}' deleted successfully."
-                else:
-                    return f"⚠ Folder does not exist: {folderpath}"
-        
-        # Handle file/folder renaming
-        elif operation == "RENAME":
-            if "FROM" in command.upper() and "TO" in command.upper():
-                from_index = command.upper().find("FROM ")
-                to_index = command.upper().find(" TO ")
-                
-                if from_index != -1 and to_index != -1:
-                    old_path = command[from_index + 5:to_index].strip()
-                    new_path = command[to_index + 4:].strip()
-                    
-                    if os.path.exists(old_path):
-                        new_dir = os.path.dirname(new_path)
-                        if new_dir and not os.path.exists(new_dir):
-                            os.makedirs(new_dir, exist_ok=True)
-                            
-                        os.rename(old_path, new_path)
-                        
-                        if "FILE" in parts:
-                            return f"🔄 File renamed from '{old_path}' to '{new_path}'."
-                        else:
-                            return f"🔄 Folder renamed from '{old_path}' to '{new_path}'."
-                    else:
-                        return f"⚠ Source path does not exist: {old_path}"
-        
-        # Handle file/folder moving
-        elif operation == "MOVE":
-            if "FROM" in command.upper() and "TO" in command.upper():
-                from_index = command.upper().find("FROM ")
-                to_index = command.upper().find(" TO ")
-                
-                if from_index != -1 and to_index != -1:
-                    src_path = command[from_index + 5:to_index].strip()
-                    dest_path = command[to_index + 4:].strip()
-                    
-                    if os.path.exists(src_path):
-                        dest_dir = os.path.dirname(dest_path)
-                        if dest_dir and not os.path.exists(dest_dir):
-                            os.makedirs(dest_dir, exist_ok=True)
-                            
-                        shutil.move(src_path, dest_path)
-                        
-                        if "FILE" in parts:
-                            return f"📂 File moved from '{src_path}' to '{dest_path}'."
-                        else:
-                            return f"📂 Folder moved from '{src_path}' to '{dest_path}'."
-                    else:
-                        return f"⚠ Source path does not exist: {src_path}"
-        
-        return "⚠ Command not recognized or incorrectly formatted."
-    
+        with metrics.timer("ultron_phase_duration_seconds", phase="parsing"):
+            op = parse_formatted_command(command)
+        if op is None:
+            metrics.inc("ultron_operation_errors_total", operation="UNPARSED")
+            return "⚠ Command not recognized or incorrectly formatted."
     except Exception as e:
+        metrics.inc("ultron_operation_errors_total", operation="UNPARSED")
         return f"⚠ Error: {e}"
 
+    operation = op["operation"]
+    metrics.inc("ultron_operations_total", operation=operation)
+    started = time.perf_counter()
+    try:
+        result = execute_operation(op, progress, stat_cache)
+    except Exception as e:
+        result = f"⚠ Error: {e}"
+    finally:
+        elapsed = time.perf_counter() - started
+        metrics.observe("ultron_phase_duration_seconds", elapsed, phase="execution")
+        metrics.observe("ultron_operation_duration_seconds", elapsed, operation=operation)
+    if result.startswith("⚠"):
+        metrics.inc("ultron_operation_errors_total", operation=operation)
+    return result
+
+# Multi-step plans: one classification can return several formatted commands,
+# one per line. Steps that touch unrelated paths run concurrently.
+PLAN_WORKERS = config.get("plan_workers", 4)
+
+def _path_key(path):
+    """Normalizes a path for overlap checks, treating both separators and any case as equal."""
+    if not (os.path.isabs(path) or ntpath.isabs(path)):
+        path = os.path.join(os.getcwd(), path)
+    return path.replace("\\", "/").rstrip("/").lower()
+
+def _paths_overlap(first, second):
+    return first == second or first.startswith(second + "/") or second.startswith(first + "/")
+
+def _operation_resources(op):
+    """Returns the paths and devices an operation touches, or None if it affects everything."""
+    if op is None:
+        return set()
+    operation = op["operation"]
+    if operation == "NAVIGATE":
+        return None
+    if operation in ("VOLUME", "BRIGHTNESS"):
+        return {("device", operation)}
+    if op.get("object") == "ALL":
+        return {("path", _path_key(op[key])) for key in ("directory", "destination") if key in op}
+    if operation in ("CREATE", "DELETE"):
+        return {("path", _path_key(op["path"]))}
+    return {("path", _path_key(op["source"])), ("path", _path_key(op["destination"]))}
+
+def plan_dependencies(steps):
+    """Works out which earlier steps each step of a plan has to wait for."""
+    resources = []
+    for step in steps:
+        try:
+            resources.append(_operation_resources(parse_formatted_command(step)))
+        except Exception:
+            resources.append(set())
+
+    dependencies = []
+    for i, own in enumerate(resources):
+        waits_for = set()
+        for j in range(i):
+            other = resources[j]
+            if own is None or other is None:
+                # Navigation changes the working directory for everything after it
+                waits_for.add(j)
+                continue
+            if any(kind == other_kind and (_paths_overlap(a, b) if kind == "path" else a == b)
+                   for kind, a in own for other_kind, b in other):
+                waits_for.add(j)
+        dependencies.append(waits_for)
+    return dependencies
+
+def execute_plan(steps, progress=None, stat_cache=None):
+    """Executes a multi-step plan, running independent steps in parallel.
+
+    Returns one result dictionary per step, in plan order. Steps whose
+    dependencies failed are skipped.
+    """
+    dependencies = plan_dependencies(steps)
+    results = [None] * len(steps)
+    pending = set(range(len(steps)))
+
+    with ThreadPoolExecutor(max_workers=PLAN_WORKERS) as executor:
+        running = {}
+        while pending or running:
+            scheduled = True
+            while scheduled:
+                # Skipping a step can unblock later ones, so keep scheduling until nothing changes
+                scheduled = False
+                for i in sorted(pending):
+                    if any(results[j] is None for j in dependencies[i]):
+                        continue
+                    pending.discard(i)
+                    scheduled = True
+                    failed = sorted(j + 1 for j in dependencies[i] if results[j]["status"] != "ok")
+                    if failed:
+                        results[i] = {"step": i + 1, "command": steps[i], "status": "skipped",
+                                      "response": f"⏭ Skipped because step {failed[0]} did not succeed."}
+                    else:
+                        running[executor.submit(interpret_command, steps[i], progress, stat_cache)] = i
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = running.pop(future)
+                response = future.result()
+                results[i] = {"step": i + 1, "command": steps[i], "response": response,
+                              "status": "error" if response.startswith("⚠") else "ok"}
+    return results
+
+def run_formatted_command(formatted_command, progress=None, stat_cache=None):
+    """Executes a formatted command or multi-step plan and builds the API response.
+
+    All steps share one PlanStatCache; pass stat_cache to share it across several commands.
+    """
+    stats = stat_cache or PlanStatCache()
+    try:
+        steps = [line.strip() for line in formatted_command.strip().splitlines() if line.strip()]
+        if len(steps) <= 1:
+            return {"response": interpret_command(formatted_command, progress, stats)}
+        results = execute_plan(steps, progress, stats)
+        return {"response": "\n".join(result["response"] for result in results), "steps": results}
+    finally:
+        if stat_cache is None:
+            stats.publish()
+
+class CommandHistory:
+    """Append-only command history stored as JSON lines.
+
+    Records are buffered and written in batches with one fsync per batch.
+    The active file is rotated once it passes max_bytes. When there are more
+    than max_segments rotated files, the rotated files are compacted into one
+    that keeps only the newest max_records records.
+    """
+
+    def __init__(self, path, max_bytes=1024 * 1024, max_segments=5, max_records=10000,
+                 flush_interval=1.0, flush_records=50, legacy_path=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_segments = max_segments
+        self.max_records = max_records
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.flush_timer = None
+        if legacy_path:
+            self._import_legacy(legacy_path)
+
+    def _import_legacy(self, legacy_path):
+        """One-time import of the old single-array command_history.json."""
+        # Rotated segments count too: right after a rotation there is no active file
+        if self.segments() or not os.path.exists(legacy_path):
+            return
+        try:
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except (OSError, ValueError) as e:
+            print(f"⚠ Could not import legacy command history: {e}")
+
+    def segments(self):
+        """Returns history files from oldest to newest."""
+        rotated = []
+        index = 1
+        while os.path.exists(f"{self.path}.{index}"):
+            rotated.append(f"{self.path}.{index}")
+            index += 1
+        return list(reversed(rotated)) + ([self.path] if os.path.exists(self.path) else [])
+
+    def append(self, command, formatted, result):
+        record = {
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "command": command,
+            "formatted": formatted,
+            "result": result,
+        }
+        with self.lock:
+            self.buffer.append(record)
+            flush_now = len(self.buffer) >= self.flush_records
+            if not flush_now and self.flush_timer is None:
+                self.flush_timer = threading.Timer(self.flush_interval, self.flush)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+        if flush_now:
+            self.flush()
+
+    def flush(self):
+        """Writes buffered records with a single fsync, rotating the file if it grew too large."""
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            if not self.buffer:
+                return
+            records, self.buffer = self.buffer, []
+            try:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+                    f.flush()
+                    os.fsync(f.fileno())
+                if os.path.getsize(self.path) >= self.max_bytes:
+                    self._rotate()
+            except OSError as e:
+                print(f"⚠ Could not write command history: {e}")
+
+    def _rotate(self):
+        rotated = self.segments()[:-1]
+        for index in range(len(rotated), 0, -1):
+            os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        if len(rotated) + 1 > self.max_segments:
+            self._compact()
+
+    def _compact(self):
+        """Merges all rotated files into one holding the newest max_records records."""
+        rotated = [segment for segment in self.segments() if segment != self.path]
+        kept = deque(maxlen=self.max_records)
+        for segment in rotated:
+            with open(segment, 'r', encoding='utf-8') as f:
+                kept.extend(line for line in f if line.strip())
+        temp_path = f"{self.path}.compact"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.writelines(kept)
+            f.flush()
+            os.fsync(f.fileno())
+        for segment in rotated:
+            os.remove(segment)
+        os.replace(temp_path, f"{self.path}.1")
+
+    @staticmethod
+    def _lines_reversed(f, chunk_size=64 * 1024):
+        """Yields the lines of a binary file from last to first, reading it backwards in chunks."""
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b""
+        while position > 0:
+            step = min(chunk_size, position)
+            position -= step
+            f.seek(position)
+            lines = (f.read(step) + remainder).split(b"\n")
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line.decode('utf-8')
+        if remainder.strip():
+            yield remainder.decode('utf-8')
+
+    @staticmethod
+    def _open_segment(segment):
+        """Returns an open history file, or None if a rotation has removed it since it was listed."""
+        if not isinstance(segment, str):
+            return segment
+        try:
+            return open(segment, 'rb')
+        except FileNotFoundError:
+            return None
+
+    def iter_records(self, newest_first=True):
+        """Streams every record, including ones not yet flushed, without loading the history."""
+        with self.lock:
+            pending = list(self.buffer)
+            segments = self.segments()
+            if os.name != "nt":
+                # Open files keep their contents when a flush renames or compacts them away, so
+                # opening them all here pins a consistent snapshot. Windows would refuse those
+                # renames instead, so there each file is opened when it is reached.
+                segments = [open(segment, 'rb') for segment in segments]
+        try:
+            if newest_first:
+                yield from reversed(pending)
+                for segment in reversed(segments):
+                    f = self._open_segment(segment)
+                    if f is None:
+                        continue
+                    with f:
+                        for line in self._lines_reversed(f):
+                            yield json.loads(line)
+            else:
+                for segment in segments:
+                    f = self._open_segment(segment)
+                    if f is None:
+                        continue
+                    with f:
+                        for line in f:
+                            if line.strip():
+                                yield json.loads(line)
+                yield from pending
+        finally:
+            for segment in segments:
+                if not isinstance(segment, str):
+                    segment.close()
+
+    def page(self, offset=0, limit=50, newest_first=True):
+        return list(islice(self.iter_records(newest_first), offset, offset + limit))
+
+with startup_step("history"):
+    command_history = CommandHistory(
+        os.path.join(BASE_DIR, config.get("history_file", "command_history.jsonl")),
+        max_bytes=config.get("history_max_bytes", 1024 * 1024),
+        max_segments=config.get("history_max_segments", 5),
+        max_records=config.get("history_max_records", 10000),
+        flush_interval=config.get("history_flush_seconds", 1.0),
+        legacy_path=os.path.join(BASE_DIR, "command_history.json"),
+    )
+atexit.register(command_history.flush)
+
+# Streaming speech: 16-bit mono PCM (raw or as a WAV file) is posted in chunks,
+# gated by an energy-based voice activity detector and transcribed offline with
+# vosk. Partial transcripts are classified while the user is still talking.
+SPEECH_SAMPLE_RATE = config.get("speech_sample_rate", 16000)
+SPEECH_MODEL_PATH = config.get("speech_model_path", "vosk-model-small-en-us")
+SPEECH_MAX_SECONDS = config.get("speech_max_seconds", 30)
+SPEECH_PREFETCH_MS = config.get("speech_prefetch_ms", 300)
+VAD_FRAME_MS = config.get("vad_frame_ms", 30)
+VAD_ENERGY_THRESHOLD = config.get("vad_energy_threshold", 500)
+VAD_SILENCE_MS = config.get("vad_silence_ms", 700)
+SPEECH_CHUNK_BYTES = 4096
+
+metrics.describe("ultron_speech_intent_lag_seconds", "histogram", "Time from the end of speech to a classified intent.")
+
+class EnergyVAD:
+    """Energy-based voice activity detector over fixed-size 16-bit PCM frames.
+
+    Speech starts at the first frame whose RMS energy reaches the threshold and
+    ends after silence_ms of quiet frames. Frames from just before the start are
+    kept so the first syllable isn't clipped.
+    """
+
+    def __init__(self, sample_rate, frame_ms=30, threshold=500, silence_ms=700, preroll_ms=300):
+        self.frame_bytes = int(sample_rate * frame_ms / 1000) * 2
+        self.threshold = threshold
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.preroll = deque(maxlen=max(1, preroll_ms // frame_ms))
+        self.in_speech = False
+        self.ended = False
+        self.quiet_frames = 0
+
+    @staticmethod
+    def energy(frame):
+        samples = array.array('h', frame)
+        if sys.byteorder == "big":
+            samples.byteswap()
+        return math.sqrt(sum(sample * sample for sample in samples) / len(samples)) if samples else 0.0
+
+    def process(self, frame):
+        """Returns the frames to pass on to the recognizer; nothing until speech starts."""
+        loud = self.energy(frame) >= self.threshold
+        if not self.in_speech:
+            self.preroll.append(frame)
+            if not loud:
+                return []
+            self.in_speech = True
+            frames = list(self.preroll)
+            self.preroll.clear()
+            return frames
+        self.quiet_frames = 0 if loud else self.quiet_frames + 1
+        if self.quiet_frames >= self.silence_frames:
+            self.ended = True
+        return [frame]
+
+speech_model = None
+speech_model_lock = threading.Lock()
+
+def create_recognizer(sample_rate):
+    """Creates a vosk recognizer, loading the model once; raises RuntimeError if it isn't available."""
+    global speech_model
+    try:
+        import vosk
+    except ImportError:
+        raise RuntimeError("Offline speech recognition needs the vosk package (pip install vosk).")
+    with speech_model_lock:
+        if speech_model is None:
+            path = os.path.join(BASE_DIR, SPEECH_MODEL_PATH)
+            if not os.path.isdir(path):
+                raise RuntimeError(f"Speech model not found at {path}. Download one from https://alphacephei.com/vosk/models")
+            vosk.SetLogLevel(-1)
+            speech_model = vosk.Model(path)
+    return vosk.KaldiRecognizer(speech_model, sample_rate)
+
+class SpeechSession:
+    """Runs one utterance through the VAD and recognizer, classifying the transcript as it firms up.
+
+    feed() and finish() return (event, data) pairs: "partial" transcripts,
+    early "intent" guesses from the local parser, and "final" when the
+    utterance ends. A transcript that stops changing is sent for full
+    classification in the background, so Gemini is often done by the time
+    the user stops speaking.
+    """
+
+    def __init__(self, recognizer, sample_rate):
+        self.recognizer = recognizer
+        self.vad = EnergyVAD(sample_rate, VAD_FRAME_MS, VAD_ENERGY_THRESHOLD, VAD_SILENCE_MS)
+        self.buffer = bytearray()
+        self.segments = []
+        self.transcript = ""
+        self.stable_ms = 0
+        self.heard_ms = 0
+        self.prepared = None
+        self.final_text = None
+        self.ended_at = None
+
+    def _update_transcript(self, events):
+        partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        transcript = " ".join(part for part in self.segments + [partial] if part)
+        if transcript != self.transcript:
+            self.transcript = transcript
+            self.stable_ms = 0
+            events.append(("partial", {"text": transcript}))
+            formatted = parse_command_locally(transcript) if transcript else None
+            if formatted:
+                events.append(("intent", {"command": transcript, "formatted": formatted, "early": True}))
+            return
+        self.stable_ms += VAD_FRAME_MS
+        if transcript and self.stable_ms >= SPEECH_PREFETCH_MS and transcript != self.prepared:
+            # Audio time already debounced it, so classification can start right away
+            self.prepared = transcript
+            speculative_classifier.prepare(transcript, immediate=True)
+
+    def feed(self, data):
+        events = []
+        self.buffer.extend(data)
+        frame_bytes = self.vad.frame_bytes
+        while len(self.buffer) >= frame_bytes and self.final_text is None:
+            frame = bytes(self.buffer[:frame_bytes])
+            del self.buffer[:frame_bytes]
+            self.heard_ms += VAD_FRAME_MS
+            for speech_frame in self.vad.process(frame):
+                if self.recognizer.AcceptWaveform(speech_frame):
+                    # The recognizer found a pause inside the utterance; keep what it settled on
+                    self.segments.append(json.loads(self.recognizer.Result()).get("text", ""))
+            if self.vad.in_speech:
+                self._update_transcript(events)
+            if self.vad.ended or self.heard_ms >= SPEECH_MAX_SECONDS * 1000:
+                events.extend(self.finish())
+        return events
+
+    def finish(self):
+        """Ends the utterance (end of audio or trailing silence) and returns the final transcript event."""
+        if self.final_text is not None:
+            return []
+        self.ended_at = time.perf_counter()
+        self.segments.append(json.loads(self.recognizer.FinalResult()).get("text", ""))
+        self.final_text = " ".join(part for part in self.segments if part)
+        return [("final", {"text": self.final_text})]
+
+    def classify(self):
+        """Classifies the final transcript, reusing a speculative classification of the same words."""
+        formatted = classify_or_take_prepared(self.final_text)
+        metrics.observe("ultron_speech_intent_lag_seconds", time.perf_counter() - self.ended_at)
+        return formatted
+
+def _read_exact(stream, size):
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+def read_audio_format(stream, sample_rate):
+    """Consumes a WAV header if the stream starts with one.
+
+    Returns the sample rate and any audio bytes already read. Raw PCM streams
+    keep the sample rate passed in.
+    """
+    start = _read_exact(stream, 12)
+    if start[:4] != b"RIFF" or start[8:12] != b"WAVE":
+        return sample_rate, start
+    while True:
+        header = _read_exact(stream, 8)
+        if len(header) < 8:
+            raise ValueError("WAV stream ended before its audio data.")
+        chunk_id, size = struct.unpack("<4sI", header)
+        if chunk_id == b"data":
+            return sample_rate, b""
+        body = _read_exact(stream, size + size % 2)
+        if chunk_id == b"fmt ":
+            audio_format, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", body)
+            if audio_format != 1 or channels != 1 or bits != 16:
+                raise ValueError("Speech audio must be 16-bit mono PCM.")
+
+def warm_up():
+    """Loads the slow dependencies in the background so the first local command isn't held up by them."""
+    steps = [("gemini", get_gemini_model), ("volume", volume_controller.warm_up), ("brightness", brightness_controller.warm_up)]
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"⚠ Warm-up of {name} failed: {e}")
+        startup_timings.setdefault(name, time.perf_counter() - started)
+    warm_up_done.set()
+    print("⏱ Startup: " + ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in startup_timings.items()))
+
+warm_up_done = threading.Event()
+
+def start_warm_up():
+    threading.Thread(target=warm_up, daemon=True, name="warm-up").start()
+
+metrics.describe("ultron_startup_seconds", "gauge", "Import and initialization time per startup component.")
+metrics.register_collector(lambda: [("ultron_startup_seconds", seconds, {"component": name})
+                                    for name, seconds in list(startup_timings.items())])
+
+# Stages run on a process-wide pool rather than the per-request event loop's default
+# executor, which Flask waits to shut down before it returns a response
+stage_executor = ThreadPoolExecutor(max_workers=config.get("stage_workers", 32), thread_name_prefix="stage")
+
+async def run_stage(func, *args, timeout=None):
+    """Runs a blocking pipeline stage in a worker thread so the event loop stays free.
+
+    On timeout the response goes out right away; the stage finishes in the background.
+    """
+    stage = asyncio.get_running_loop().run_in_executor(stage_executor, func, *args)
+    if timeout is None:
+        return await stage
+    return await asyncio.wait_for(stage, timeout)
+
 # Flask API endpoint to process commands
 @app.route('/api/process-command', methods=['POST'])
-def process_command():
+async def process_command():
     command = request.json.get('command', '')
     if not command:
         return jsonify({"response": "⚠ No command provided."})
     
     try:
-        gemini_response = get_task_from_gemini(command)
-        result = interpret_command(gemini_response)
-        return jsonify({"response": result})
+        formatted_command = await run_stage(classify_or_take_prepared, command, timeout=REQUEST_TIMEOUT_SECONDS)
+        result = await run_stage(run_formatted_command, formatted_command)
+        command_history.append(command, formatted_command, result["response"])
+        return jsonify(result)
+    except asyncio.TimeoutError:
+        return jsonify({"response": f"⚠ Timed out after {REQUEST_TIMEOUT_SECONDS}s waiting for command classification."})
     except Exception as e:
         return jsonify({"response": f"⚠ Error: {str(e)}"})
 
+def format_sse(event, data):
+    """Formats one Server-Sent Events message."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Flask API endpoint that streams the intent, progress and result of a command
+@app.route('/api/process-command/stream', methods=['GET', 'POST'])
+def process_command_stream():
+    if request.method == 'POST':
+        command = (request.json or {}).get('command', '')
+    else:
+        command = request.args.get('command', '')
+
+    def generate():
+        if not command:
+            yield format_sse("result", {"response": "⚠ No command provided."})
+            return
+        try:
+            formatted_command = stage_executor.submit(classify_or_take_prepared, command).result(timeout=REQUEST_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            yield format_sse("result", {"response": f"⚠ Timed out after {REQUEST_TIMEOUT_SECONDS}s waiting for command classification."})
+            return
+        except Exception as e:
+            yield format_sse("result", {"response": f"⚠ Error: {str(e)}"})
+            return
+        yield format_sse("intent", {"command": command, "formatted": formatted_command})
+        yield from stream_execution(command, formatted_command)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def stream_execution(command, formatted_command):
+    """Executes a classified command in a worker thread, yielding its progress and result as SSE messages."""
+    events = queue.Queue()
+    def execute():
+        try:
+            result = run_formatted_command(formatted_command, progress=lambda event: events.put(("progress", event)))
+        except Exception as e:
+            result = {"response": f"⚠ Error: {str(e)}"}
+        try:
+            command_history.append(command, formatted_command, result["response"])
+        finally:
+            # The generator waits for this event, so it must be sent whatever happens
+            events.put(("result", result))
+
+    threading.Thread(target=execute, daemon=True).start()
+    while True:
+        event, data = events.get()
+        yield format_sse(event, data)
+        if event == "result":
+            return
+
+# Flask API endpoint that transcribes streamed audio and executes the spoken command
+@app.route('/api/speech/stream', methods=['POST'])
+def speech_stream():
+    sample_rate = request.args.get('sample_rate', SPEECH_SAMPLE_RATE, type=int)
+    stream = request.stream
+
+    def generate():
+        try:
+            sample_rate_used, data = read_audio_format(stream, sample_rate)
+            session = SpeechSession(create_recognizer(sample_rate_used), sample_rate_used)
+        except (RuntimeError, ValueError) as e:
+            yield format_sse("result", {"response": f"⚠ {e}"})
+            return
+
+        # Stop reading as soon as the VAD hears the user finish; the client can stop sending then
+        while session.final_text is None:
+            data = data or stream.read(SPEECH_CHUNK_BYTES)
+            events = session.feed(data) if data else session.finish()
+            for event, payload in events:
+                yield format_sse(event, payload)
+            data = b""
+
+        command = session.final_text
+        if not command:
+            yield format_sse("result", {"response": "⚠ No speech detected."})
+            return
+        try:
+            formatted_command = stage_executor.submit(session.classify).result(timeout=REQUEST_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            yield format_sse("result", {"response": f"⚠ Timed out after {REQUEST_TIMEOUT_SECONDS}s waiting for command classification."})
+            return
+        except Exception as e:
+            yield format_sse("result", {"response": f"⚠ Error: {str(e)}"})
+            return
+        yield format_sse("intent", {"command": command, "formatted": formatted_command})
+        yield from stream_execution(command, formatted_command)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Flask API endpoint to process several commands with a single classification call
+@app.route('/api/process-batch', methods=['POST'])
+async def process_batch():
+    commands = request.json.get('commands', [])
+    stop_on_error = bool(request.json.get('stop_on_error', False))
+    if not isinstance(commands, list) or not commands:
+        return jsonify({"response": "⚠ No commands provided.", "results": []})
+    commands = [str(command) for command in commands]
+
+    try:
+        formatted_commands = await run_stage(classify_commands, commands, timeout=REQUEST_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        return jsonify({"response": f"⚠ Timed out after {REQUEST_TIMEOUT_SECONDS}s waiting for command classification.", "results": []})
+    except Exception as e:
+        return jsonify({"response": f"⚠ Error: {str(e)}", "results": []})
+
+    results = []
+    stats = PlanStatCache()
+    for command, formatted in zip(commands, formatted_commands):
+        if stop_on_error and results and results[-1]["status"] == "error":
+            results.append({"command": command, "formatted": formatted, "response": "⏭ Skipped after earlier error.", "status": "skipped"})
+            continue
+        result = await run_stage(run_formatted_command, formatted, None, stats)
+        command_history.append(command, formatted, result["response"])
+        steps = result.get("steps", [])
+        failed = result["response"].startswith("⚠") or any(step["status"] != "ok" for step in steps)
+        results.append({"command": command, "formatted": formatted, "status": "error" if failed else "ok", **result})
+
+    stats.publish()
+    succeeded = sum(1 for result in results if result["status"] == "ok")
+    return jsonify({"response": f"✅ {succeeded}/{len(results)} commands succeeded.", "results": results})
+
+# Flask API endpoint that classifies a command while it is still being typed or spoken
+@app.route('/api/prepare', methods=['GET', 'POST'])
+def prepare():
+    if request.method == 'GET':
+        return jsonify(speculative_classifier.snapshot())
+    text = (request.json or {}).get('text', '')
+    return jsonify({"status": speculative_classifier.prepare(text)})
+
+# Flask API endpoint to preview or run a bulk pattern operation with per-file results
+@app.route('/api/bulk', methods=['POST'])
+async def bulk_operation():
+    command = request.json.get('command', '')
+    dry_run = bool(request.json.get('dry_run', True))
+    if not command:
+        return jsonify({"response": "⚠ No command provided."})
+
+    try:
+        formatted_command = await run_stage(classify_or_take_prepared, command, timeout=REQUEST_TIMEOUT_SECONDS)
+        op = parse_bulk_command(formatted_command)
+        if op is None:
+            return jsonify({"response": "⚠ Not a bulk operation.", "formatted": formatted_command})
+        result = await run_stage(run_bulk_operation, op, dry_run)
+        if not dry_run:
+            command_history.append(command, formatted_command, result["response"])
+        return jsonify({"formatted": formatted_command, "dry_run": dry_run, **result})
+    except asyncio.TimeoutError:
+        return jsonify({"response": f"⚠ Timed out after {REQUEST_TIMEOUT_SECONDS}s waiting for command classification."})
+    except Exception as e:
+        return jsonify({"response": f"⚠ Error: {str(e)}"})
+
+# Flask API endpoint to reverse the most recent file operation
+@app.route('/api/undo', methods=['GET', 'POST'])
+def undo():
+    if request.method == 'GET':
+        return jsonify({"operations": operation_journal.history()})
+    try:
+        result = operation_journal.undo()
+    except Exception as e:
+        result = f"⚠ Error: {e}"
+    return jsonify({"response": result})
+
+# Flask API endpoint reporting readiness and where startup time went
+@app.route('/api/health', methods=['GET'])
+def health():
+    return jsonify({
+        "status": "ready" if warm_up_done.is_set() else "warming_up",
+        "uptime_seconds": round(time.perf_counter() - STARTUP_STARTED, 3),
+        "components": {
+            "local_parser": True,
+            "gemini": model is not None,
+            "file_index": file_index.ready.is_set() or not file_index.roots,
+        },
+        "startup_ms": {name: round(seconds * 1000, 2) for name, seconds in list(startup_timings.items())},
+    })
+
+# Flask API endpoint to page through command history, newest first by default
+@app.route('/api/history', methods=['GET'])
+def history():
+    newest_first = request.args.get('order', 'desc') != 'asc'
+    if request.args.get('format') == 'jsonl':
+        # Stream the whole history without holding it in memory
+        records = command_history.iter_records(newest_first)
+        return Response((json.dumps(record, ensure_ascii=False) + "\n" for record in records),
+                        mimetype='application/x-ndjson')
+
+    offset = max(0, request.args.get('offset', 0, type=int))
+    limit = max(1, min(500, request.args.get('limit', 50, type=int)))
+    records = command_history.page(offset, limit, newest_first)
+    return jsonify({"offset": offset, "limit": limit, "records": records})
+
+# Flask API endpoint to report how often the local parser avoids Gemini
+@app.route('/api/parser-stats', methods=['GET'])
+def parser_stats():
+    with local_parser_stats_lock:
+        hits = local_parser_stats["hits"]
+        misses = local_parser_stats["misses"]
+    total = hits + misses
+    return jsonify({
+        "hits": hits,
+        "misses": misses,
+        "fallback_rate": misses / total if total else 0.0
+    })
+
+# Flask API endpoint to report Gemini token usage and latency
+@app.route('/api/gemini-usage', methods=['GET'])
+def gemini_usage():
+    with gemini_usage_lock:
+        usage = dict(gemini_usage_stats)
+    calls = usage["calls"]
+    usage["average_latency_seconds"] = usage["latency_seconds"] / calls if calls else 0.0
+    usage["system_instruction_characters"] = len(GEMINI_SYSTEM_INSTRUCTION)
+    return jsonify(usage)
+
+# Flask API endpoint to inspect the Gemini classification cache
+@app.route('/api/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify(classification_cache.stats())
+
+# Flask API endpoint exposing metrics in Prometheus text format
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Flask API endpoint to inspect the file-name index or look a name up in it
+@app.route('/api/file-index', methods=['GET'])
+def file_index_status():
+    name = request.args.get('name')
+    if name:
+        return jsonify({"name": name, "matches": file_index.lookup(name)})
+    return jsonify(file_index.stats())
+
 # Flask API endpoint to provide help information
 @app.route('/api/get-help', methods=['GET'])
 def get_help():
@@ -517,4 +3238,9 @@ def get_help():
     return jsonify(help_info)
 
 if __name__ == "__main__":  # Fixed underscores
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # With debug on, werkzeug's reloader re-runs this file in a child process that does the serving;
+    # only that process should walk the index, hold inotify watches and warm up the backends
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_warm_up()
+        file_index.start()
+    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
\ No newline at end of file
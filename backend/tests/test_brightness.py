@@ -0,0 +1,64 @@
+import pytest
+
+import final
+
+
+@pytest.fixture
+def backlight(tmp_path):
+    """A fake /sys/class/backlight with one device at max 1200, currently at half."""
+    device = tmp_path / "intel_backlight"
+    device.mkdir()
+    (device / "max_brightness").write_text("1200\n")
+    (device / "brightness").write_text("600\n")
+    return tmp_path
+
+
+def test_sysfs_level_is_scaled_to_max_brightness(backlight):
+    controller = final.BrightnessController(system="Linux", backlight_dir=str(backlight))
+
+    assert controller.get_level() == 50
+    assert controller.set_level(75) == 75
+    assert (backlight / "intel_backlight" / "brightness").read_text() == "900"
+    assert controller.get_level() == 75
+
+
+def test_sysfs_adjust_clamps_to_range(backlight):
+    controller = final.BrightnessController(system="Linux", backlight_dir=str(backlight))
+
+    assert controller.adjust(20) == 70
+    assert (backlight / "intel_backlight" / "brightness").read_text() == "840"
+    assert controller.adjust(60) == 100
+    assert (backlight / "intel_backlight" / "brightness").read_text() == "1200"
+    assert controller.adjust(-150) == 0
+    assert (backlight / "intel_backlight" / "brightness").read_text() == "0"
+
+
+def test_max_brightness_is_read_once(backlight):
+    controller = final.BrightnessController(system="Linux", backlight_dir=str(backlight))
+    controller.warm_up()
+    (backlight / "intel_backlight" / "max_brightness").write_text("not a number\n")
+
+    controller.set_level(25)
+
+    assert (backlight / "intel_backlight" / "brightness").read_text() == "300"
+
+
+def test_missing_backlight_falls_back_to_xbacklight(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(final, "run_quietly", calls.append)
+    controller = final.BrightnessController(system="Linux", backlight_dir=str(tmp_path / "missing"))
+
+    assert controller.get_level() is None
+    assert controller.adjust(-10) is None
+    controller.set_level(40)
+
+    assert calls == [["xbacklight", "-dec", "10"], ["xbacklight", "-set", "40"]]
+
+
+def test_scheduler_writes_burst_to_sysfs(backlight):
+    scheduler = final.AdjustmentScheduler(final.BrightnessController(system="Linux", backlight_dir=str(backlight)))
+
+    levels = [scheduler.adjust(10) for _ in range(3)]
+
+    assert levels == [60, 70, 80]
+    assert (backlight / "intel_backlight" / "brightness").read_text() == "960"
@@ -0,0 +1,126 @@
+import array
+import json
+import math
+import wave
+
+import pytest
+
+import final
+
+SAMPLE_RATE = 16000
+TRANSCRIPT = "create folder {}"
+
+
+class FakeRecognizer:
+    """Stands in for vosk.KaldiRecognizer: reveals one more word per 400 ms of audio it is given."""
+
+    def __init__(self, text):
+        self.words = text.split()
+        self.accepted = 0
+
+    def _heard(self):
+        return self.words[:self.accepted // (SAMPLE_RATE * 2 * 2 // 5)]
+
+    def AcceptWaveform(self, data):
+        self.accepted += len(data)
+        return False
+
+    def PartialResult(self):
+        return json.dumps({"partial": " ".join(self._heard())})
+
+    def Result(self):
+        return json.dumps({"text": " ".join(self._heard())})
+
+    def FinalResult(self):
+        return json.dumps({"text": " ".join(self.words)})
+
+
+def write_wav(path, segments):
+    """Writes 16-bit mono PCM made of (seconds, amplitude) stretches of a 440 Hz tone."""
+    samples = array.array('h')
+    for seconds, amplitude in segments:
+        for i in range(int(seconds * SAMPLE_RATE)):
+            samples.append(int(amplitude * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE)))
+    with wave.open(str(path), 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+    return path
+
+
+def read_events(response):
+    events = []
+    for message in response.get_data(as_text=True).split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in message.splitlines() if ": " in line)
+        if "event" in lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def utterance(tmp_path):
+    """Half a second of silence, 1.5 s of speech-level tone, then a second of silence."""
+    return write_wav(tmp_path / "utterance.wav", [(0.5, 0), (1.5, 8000), (1.0, 0)])
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(final, "command_history", final.CommandHistory(str(tmp_path / "history.jsonl")))
+    monkeypatch.setattr(final, "operation_journal", final.OperationJournal(
+        str(tmp_path / "journal.jsonl"), backup_directory=str(tmp_path / "backups")))
+    monkeypatch.setattr(final, "speculative_classifier", final.SpeculativeClassifier(final.get_task_from_gemini))
+    monkeypatch.setattr(final, "get_task_from_gemini", lambda command: pytest.fail(f"Gemini called for {command!r}"))
+    return final.app.test_client()
+
+
+def use_recognizer(monkeypatch, text):
+    # A synthesized tone has no words in it, so the fake stands in for vosk even where vosk is installed
+    monkeypatch.setattr(final, "create_recognizer", lambda sample_rate: FakeRecognizer(text))
+
+
+def test_wav_utterance_streams_transcript_and_executes(client, utterance, tmp_path, monkeypatch):
+    folder = tmp_path / "demo"
+    use_recognizer(monkeypatch, TRANSCRIPT.format(folder))
+
+    with open(utterance, 'rb') as audio:
+        response = client.post('/api/speech/stream', data=audio, content_type='audio/wav')
+    events = read_events(response)
+    names = [name for name, _ in events]
+
+    assert response.mimetype == "text/event-stream"
+    partials = [data["text"] for name, data in events if name == "partial"]
+    assert partials[0] == "create"
+    assert partials[-1] == TRANSCRIPT.format(folder)
+    assert names.count("final") == 1
+    assert names.index("final") < names.index("result")
+    intent = [data for name, data in events if name == "intent" and not data.get("early")]
+    assert intent == [{"command": TRANSCRIPT.format(folder), "formatted": f"CREATE FOLDER {folder}"}]
+    assert events[-1][0] == "result"
+    assert folder.is_dir()
+
+
+def test_silent_wav_reports_no_speech(client, tmp_path, monkeypatch):
+    use_recognizer(monkeypatch, "")
+    silence = write_wav(tmp_path / "silence.wav", [(1.0, 0)])
+
+    with open(silence, 'rb') as audio:
+        events = read_events(client.post('/api/speech/stream', data=audio, content_type='audio/wav'))
+
+    assert [name for name, _ in events] == ["final", "result"]
+    assert events[-1][1]["response"] == "⚠ No speech detected."
+
+
+def test_stereo_wav_is_rejected(client, tmp_path, monkeypatch):
+    use_recognizer(monkeypatch, "")
+    stereo = tmp_path / "stereo.wav"
+    with wave.open(str(stereo), 'wb') as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(b"\0" * 4000)
+
+    with open(stereo, 'rb') as audio:
+        events = read_events(client.post('/api/speech/stream', data=audio, content_type='audio/wav'))
+
+    assert events == [("result", {"response": "⚠ Speech audio must be 16-bit mono PCM."})]
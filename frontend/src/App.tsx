@@ -62,6 +62,7 @@ function App() {
   ]);
   const [helpInfo, setHelpInfo] = useState<HelpInfo | null>(null);
   const [showHelp, setShowHelp] = useState(false);
+  const [progressText, setProgressText] = useState('');
   
   // Use Timer type instead of NodeJS.Timeout
   const autoSubmitTimerRef = useRef<Timer | null>(null);
@@ -182,7 +183,7 @@ function App() {
     setResponses(prev => [...prev, { text: message, isUser: true }]);
 
     try {
-      const response = await fetch('http://localhost:5000/api/process-command', {
+      const response = await fetch('http://localhost:5000/api/process-command/stream', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -190,18 +191,47 @@ function App() {
         body: JSON.stringify({ command: message }),
       });
       
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error('Network response was not ok');
       }
       
-      const data = await response.json();
-      const aiResponse = data.response || "I couldn't process that command. Please try again.";
+      // Read Server-Sent Events: the parsed intent, progress updates, then the result
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let aiResponse = "I couldn't process that command. Please try again.";
       
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        const events = buffer.split('\n\n');
+        buffer = events.pop() || '';
+        for (const rawEvent of events) {
+          const eventLine = rawEvent.split('\n').find(line => line.startsWith('event: '));
+          const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+          if (!eventLine || !dataLine) continue;
+          
+          const event = eventLine.slice(7);
+          const data = JSON.parse(dataLine.slice(6));
+          if (event === 'intent') {
+            setProgressText(`Running ${data.formatted}...`);
+          } else if (event === 'progress') {
+            setProgressText(`${data.operation}: ${data.files} files, ${(data.bytes / (1024 * 1024)).toFixed(1)} MB`);
+          } else if (event === 'result') {
+            aiResponse = data.response || aiResponse;
+          }
+        }
+      }
+      
+      setProgressText('');
       setResponses(prev => [...prev, { text: aiResponse, isUser: false }]);
       speak(aiResponse);
     } catch (error) {
       console.error('Error processing command:', error);
       const errorResponse = "Sorry, there was an error processing your command. Please try again.";
+      setProgressText('');
       setResponses(prev => [...prev, { text: errorResponse, isUser: false }]);
       speak(errorResponse);
       setIsProcessing(false);
@@ -232,6 +262,23 @@ function App() {
     };
   }, [message]);
 
+  // Classify the command while it is still being typed or spoken, so submitting it is instant
+  useEffect(() => {
+    if (!message.trim()) return;
+
+    const prepareTimer = setTimeout(() => {
+      fetch('http://localhost:5000/api/prepare', {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({ text: message }),
+      }).catch(error => console.error('Error preparing command:', error));
+    }, 300);
+
+    return () => clearTimeout(prepareTimer);
+  }, [message]);
+
   const messagesEndRef = useRef<HTMLDivElement>(null);
   
   useEffect(() => {
@@ -400,7 +447,7 @@ function App() {
             )}
             {isProcessing && (
               <div className="text-xs text-yellow-400 mt-2 flex items-center">
-                <span>Processing your command...</span>
+                <span>{progressText || 'Processing your command...'}</span>
               </div>
             )}
           </motion.div>